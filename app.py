@@ -1,8 +1,22 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Flask, Response, render_template, request, redirect, url_for, flash, jsonify,
+                   make_response, session, stream_with_context)
+from werkzeug.http import is_resource_modified
+from markupsafe import Markup, escape
 import os
+import codecs
 import datetime
+import functools
+import hashlib
 from schema import initialize_database
-from models import Category, Flashcard
+from models import (DatabaseManager, Category, Flashcard, StudyStats, HIGHLIGHT_START, HIGHLIGHT_END,
+                    get_data_versions)
+from scheduler import parse_timestamp, utcnow
+from review_buffer import ReviewWriteBuffer
+from importer import FORMATS as IMPORT_FORMATS, DeckImporter, detect_format
+from exporter import DeckExporter, CONTENT_TYPES
+from fragment_cache import FragmentCache
+from metrics import Metrics
+from slow_query_log import SlowQueryLog
 
 # Initialize the database
 initialize_database()
@@ -16,26 +30,128 @@ app.secret_key = os.urandom(24)  # For flash messages and sessions
 def inject_now():
     return {'now': datetime.datetime.now()}
 
-# Initialize models
-category_model = Category()
-flashcard_model = Flashcard()
+@app.template_filter('highlight')
+def highlight_filter(text):
+    """Escape a search result and turn its match markers into <mark> tags"""
+    return Markup(str(escape(text or ''))
+                  .replace(HIGHLIGHT_START, '<mark>')
+                  .replace(HIGHLIGHT_END, '</mark>'))
+
+# Initialize models (sharing one connection pool per worker process)
+db_manager = DatabaseManager()
+
+# Rendered cards and category filters, reused while their data is unchanged
+fragment_cache = FragmentCache.from_env()
+
+category_model = Category(db_manager, fragment_cache=fragment_cache)
+flashcard_model = Flashcard(db_manager, fragment_cache=fragment_cache)
+study_stats = StudyStats(db_manager)
+
+deck_importer = DeckImporter(db_manager)
+deck_exporter = DeckExporter(db_manager)
+
+# Optional group-commit buffer for review ratings (REVIEW_WRITE_BEHIND=1)
+review_buffer = ReviewWriteBuffer.from_env(flashcard_model)
+
+# Request latency and SQL statement metrics, served on /metrics (METRICS_ENABLED=0 to disable)
+metrics = Metrics.from_env()
+if metrics:
+    metrics.init_app(app, db_manager)
+
+# Statements slower than SLOW_QUERY_MS are logged with their query plan
+slow_query_log = SlowQueryLog.from_env(db_manager)
+
+@app.template_global()
+def render_flashcard_cards(cards):
+    """Render cards for the flashcard grid, skipping Jinja for cards already rendered"""
+    template = app.jinja_env.get_template('_flashcard_card.html')
+    # Category.invalidate_cache relies on the category name coming first
+    return Markup(''.join(
+        fragment_cache.get_or_render(
+            'flashcard', card['id'],
+            (card['category_name'], card['front_content'], card['back_content'], card['created_at']),
+            lambda card=card: template.render(card=card))
+        for card in cards))
+
+@app.template_global()
+def render_category_filter(categories, selected_category=None):
+    """Render the category filter buttons, cached per selected category"""
+    template = app.jinja_env.get_template('_category_filter.html')
+    return fragment_cache.get_or_render(
+        'category_filter', selected_category['id'] if selected_category else None,
+        tuple((category['id'], category['name']) for category in categories),
+        lambda: template.render(categories=categories, selected_category=selected_category))
+
+# Templates are part of every rendered page, so a deploy that changes them
+# must change the ETags too; the mtime is the same in every worker process
+TEMPLATES_VERSION = max(
+    (os.path.getmtime(os.path.join(root, name))
+     for root, _, names in os.walk(os.path.join(app.root_path, app.template_folder))
+     for name in names),
+    default=0)
+
+def conditional(*tables):
+    """Answer GET requests with 304 Not Modified while the given tables are unchanged
+    
+    The ETag is derived from the tables' change counters, so a revalidation
+    costs one small query and no rendering.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # Flashed messages are shown once by the render, so that page can't be reused
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+            
+            # Read the versions before rendering: a write in between only makes
+            # the ETag older than the page, which costs one extra render later
+            with db_manager.connection() as conn:
+                versions = get_data_versions(conn.cursor(), tables)
+            
+            # The footer shows the local year, and due counts change with the UTC date
+            key = '|'.join([request.full_path, str(TEMPLATES_VERSION), str(datetime.date.today().year),
+                            utcnow().date().isoformat()] +
+                           [f'{name}={versions[name][0]}' for name in sorted(versions)])
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            last_modified = max((parse_timestamp(updated_at) for _, updated_at in versions.values()
+                                 if updated_at), default=None)
+            
+            if not is_resource_modified(request.environ, etag, last_modified=last_modified):
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Let browsers keep the page but revalidate it on every use
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
 
 # Routes
 @app.route('/')
+@conditional('categories', 'flashcards')
 def index():
     """Home page showing categories and recent flashcards"""
     categories = category_model.get_all_categories()
-    recent_flashcards = flashcard_model.get_all_flashcards()
+    card_counts = category_model.get_card_counts()
+    recent_flashcards = flashcard_model.get_recent_flashcards(limit=10)
     return render_template('index.html', 
                            categories=categories, 
-                           recent_flashcards=recent_flashcards[:10] if recent_flashcards else [])
+                           card_counts=card_counts,
+                           recent_flashcards=recent_flashcards)
 
 # Category routes
 @app.route('/categories')
+@conditional('categories', 'flashcards')
 def list_categories():
-    """List all categories"""
+    """List all categories with their card counts"""
     categories = category_model.get_all_categories()
-    return render_template('categories.html', categories=categories)
+    card_counts = category_model.get_card_counts()
+    return render_template('categories.html', categories=categories, card_counts=card_counts)
 
 @app.route('/categories/add', methods=['GET', 'POST'])
 def add_category():
@@ -100,24 +216,45 @@ def delete_category(category_id):
     return redirect(url_for('list_categories'))
 
 # Flashcard routes
+FLASHCARDS_PAGE_SIZE = 30
+
 @app.route('/flashcards')
+@conditional('categories', 'flashcards')
 def list_flashcards():
-    """List all flashcards, optionally filtered by category"""
+    """List flashcards page by page, optionally filtered by category"""
     category_id = request.args.get('category_id', type=int)
     categories = category_model.get_all_categories()
     
+    page = flashcard_model.get_flashcards_page(category_id, limit=FLASHCARDS_PAGE_SIZE)
     if category_id:
-        flashcards = flashcard_model.get_all_flashcards(category_id)
         selected_category = category_model.get_category_by_id(category_id)
     else:
-        flashcards = flashcard_model.get_all_flashcards()
         selected_category = None
     
     return render_template('flashcards.html', 
-                           flashcards=flashcards, 
+                           flashcards=page['flashcards'], 
+                           next_cursor=page['next_cursor'],
                            categories=categories,
                            selected_category=selected_category)
 
+SEARCH_PAGE_SIZE = 20
+
+@app.route('/flashcards/search')
+@conditional('categories', 'flashcards')
+def search_flashcards():
+    """Search flashcards by front and back content"""
+    query = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    
+    results = flashcard_model.search_flashcards(query, limit=SEARCH_PAGE_SIZE, 
+                                                offset=(page - 1) * SEARCH_PAGE_SIZE)
+    
+    return render_template('search.html', 
+                           query=query, 
+                           page=page,
+                           flashcards=results['flashcards'], 
+                           has_more=results['has_more'])
+
 @app.route('/flashcards/add', methods=['GET', 'POST'])
 def add_flashcard():
     """Add a new flashcard"""
@@ -147,6 +284,59 @@ def add_flashcard():
     
     return render_template('flashcard_form.html', categories=categories)
 
+@app.route('/flashcards/import', methods=['GET', 'POST'])
+def import_flashcards():
+    """Import flashcards from an uploaded CSV or JSONL deck"""
+    categories = category_model.get_all_categories()
+    
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        
+        if not upload or not upload.filename:
+            flash('Please choose a deck file to import', 'error')
+            return render_template('import_form.html', categories=categories)
+        
+        default_category = None
+        category_id = request.form.get('category_id', type=int)
+        if category_id:
+            category = category_model.get_category_by_id(category_id)
+            default_category = category['name'] if category else None
+        
+        fmt = request.form.get('format') or detect_format(upload.filename)
+        if fmt not in IMPORT_FORMATS:
+            flash(f'Unknown import format: {fmt}', 'error')
+            return redirect(url_for('import_flashcards'))
+        
+        # Decode the upload lazily so large decks are streamed, not read into memory
+        stream = codecs.getreader('utf-8-sig')(upload.stream, errors='replace')
+        result = deck_importer.import_stream(stream, fmt, default_category)
+        
+        flash(f"Imported {result['imported']} flashcards ({result['skipped']} rows skipped)", 
+              'success' if result['imported'] else 'warning')
+        for error in result['errors']:
+            flash(error, 'warning')
+        return redirect(url_for('list_flashcards'))
+    
+    return render_template('import_form.html', categories=categories)
+
+@app.route('/flashcards/export')
+def export_flashcards():
+    """Download flashcards as CSV or JSONL, optionally with review history"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in CONTENT_TYPES:
+        flash(f'Unknown export format: {fmt}', 'error')
+        return redirect(url_for('list_flashcards'))
+    
+    category_id = request.args.get('category_id', type=int)
+    include_reviews = request.args.get('reviews', '0') in ('1', 'true', 'yes', 'on')
+    
+    # Rows are streamed from the database as the response is sent
+    chunks = deck_exporter.export(fmt, category_id, include_reviews)
+    filename = f"flashcards-{datetime.date.today().isoformat()}.{fmt}"
+    return Response(stream_with_context(chunks), 
+                    content_type=CONTENT_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/flashcards/edit/<int:flashcard_id>', methods=['GET', 'POST'])
 def edit_flashcard(flashcard_id):
     """Edit an existing flashcard"""
@@ -195,9 +385,29 @@ def delete_flashcard(flashcard_id):
 # Review routes
 @app.route('/review')
 def review():
-    """Review flashcards"""
-    cards = flashcard_model.get_cards_for_review()
-    return render_template('review.html', cards=cards)
+    """Review flashcards (cards are fetched in batches from /api/review/next)"""
+    return render_template('review.html', batch_size=REVIEW_BATCH_SIZE)
+
+# Cards per /api/review/next batch, and how many in-flight cards a client may exclude
+REVIEW_BATCH_SIZE = 20
+MAX_REVIEW_EXCLUDE = 500
+
+@app.route('/api/review/next')
+def next_review_cards():
+    """Get the next batch of due cards, skipping the ones the client already has"""
+    limit = max(1, min(request.args.get('limit', REVIEW_BATCH_SIZE, type=int), 100))
+    try:
+        exclude = [int(value) for value in request.args.get('exclude', '').split(',') if value]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'exclude must be a comma-separated list of ids'})
+    
+    cards = flashcard_model.get_cards_for_review(limit, exclude[-MAX_REVIEW_EXCLUDE:])
+    return jsonify({'success': True,
+                    'cards': [{'id': card['id'],
+                               'front': card['front_content'],
+                               'back': card['back_content'],
+                               'category': card['category_name'] or 'Uncategorized'}
+                              for card in cards]})
 
 @app.route('/review/record', methods=['POST'])
 def record_review():
@@ -207,12 +417,114 @@ def record_review():
     
     if not flashcard_id or not performance_rating:
         return jsonify({'success': False, 'error': 'Missing required parameters'})
+    if not valid_review(flashcard_id, performance_rating):
+        return jsonify({'success': False, 'error': 'Invalid review'}), 400
+    
+    if review_buffer:
+        review_buffer.submit([{'flashcard_id': flashcard_id, 'rating': performance_rating}])
+        return jsonify({'success': True, 'queued': True})
     
     result = flashcard_model.record_review(flashcard_id, performance_rating)
     return jsonify(result)
 
+# Largest number of ratings accepted by one batch request
+MAX_REVIEW_BATCH = 500
+
+# Ids must fit SQLite's signed 64-bit INTEGER; ratings are 1-5
+MAX_FLASHCARD_ID = 2 ** 63 - 1
+RATINGS = range(1, 6)
+
+def valid_review(flashcard_id, rating):
+    """Check that a flashcard id and rating can be stored (bools are not ints here)"""
+    return (isinstance(flashcard_id, int) and not isinstance(flashcard_id, bool)
+            and 0 < flashcard_id <= MAX_FLASHCARD_ID
+            and isinstance(rating, int) and not isinstance(rating, bool) and rating in RATINGS)
+
+def parse_client_timestamp(value):
+    """Parse an ISO 8601 timestamp sent by the browser into a naive UTC datetime"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed.replace(microsecond=0)
+
+@app.route('/review/record-batch', methods=['POST'])
+def record_review_batch():
+    """Record a batch of flashcard reviews in one transaction"""
+    data = request.get_json(silent=True) or {}
+    reviews = data.get('reviews')
+    
+    if not isinstance(reviews, list) or not reviews:
+        return jsonify({'success': False, 'error': 'Missing required parameters'})
+    if len(reviews) > MAX_REVIEW_BATCH:
+        return jsonify({'success': False, 'error': f'At most {MAX_REVIEW_BATCH} reviews per batch'})
+    
+    parsed = []
+    for review in reviews:
+        if not isinstance(review, dict):
+            return jsonify({'success': False, 'error': 'Invalid review'}), 400
+        flashcard_id = review.get('flashcard_id')
+        rating = review.get('rating')
+        if not valid_review(flashcard_id, rating):
+            return jsonify({'success': False, 'error': 'Invalid review'}), 400
+        parsed.append({'flashcard_id': flashcard_id,
+                       'rating': rating,
+                       'reviewed_at': parse_client_timestamp(review.get('reviewed_at'))})
+    
+    if review_buffer:
+        queued = review_buffer.submit(parsed)
+        return jsonify({'success': True, 'queued': queued})
+    
+    result = flashcard_model.record_reviews(parsed)
+    return jsonify(result)
+
+# Statistics routes
+# Days covered by the per-day and per-category statistics (at most MAX_STATS_DAYS)
+STATS_DAYS = 30
+MAX_STATS_DAYS = 365
+
+@app.route('/stats')
+def stats():
+    """Study statistics dashboard"""
+    days = max(1, min(request.args.get('days', STATS_DAYS, type=int), MAX_STATS_DAYS))
+    return render_template('stats.html', stats=study_stats.get_stats(days))
+
+@app.route('/api/stats')
+def stats_api():
+    """Get study statistics (for AJAX)"""
+    days = max(1, min(request.args.get('days', STATS_DAYS, type=int), MAX_STATS_DAYS))
+    return jsonify({'success': True, 'stats': study_stats.get_stats(days)})
+
 # API routes for AJAX operations
+@app.route('/api/flashcards')
+@conditional('categories', 'flashcards')
+def list_flashcards_api():
+    """Get the next page of flashcards after a cursor (for infinite scroll)"""
+    category_id = request.args.get('category_id', type=int)
+    after = request.args.get('cursor')
+    limit = max(1, min(request.args.get('limit', FLASHCARDS_PAGE_SIZE, type=int), 100))
+    
+    try:
+        page = flashcard_model.get_flashcards_page(category_id, after, limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    # format=html returns the cards rendered like the grid on the flashcards page
+    if request.args.get('format') == 'html':
+        return jsonify({'success': True,
+                        'html': str(render_flashcard_cards(page['flashcards'])),
+                        'next_cursor': page['next_cursor']})
+    
+    return jsonify({'success': True,
+                    'flashcards': [dict(card) for card in page['flashcards']],
+                    'next_cursor': page['next_cursor']})
+
 @app.route('/api/flashcards/<int:flashcard_id>')
+@conditional('categories', 'flashcards')
 def get_flashcard(flashcard_id):
     """Get a flashcard by ID (for AJAX)"""
     flashcard = flashcard_model.get_flashcard_by_id(flashcard_id)
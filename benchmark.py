@@ -0,0 +1,422 @@
+"""Reproducible benchmarks for the models and Flask routes
+
+Builds synthetic databases at several sizes, then times every Category and
+Flashcard method and every route (through the Flask test client) against
+each one. For every operation the results record p50/p95/p99 latency, the
+number of SQL statements it executes and its peak Python memory, and are
+written to a JSON file that later runs can be compared against.
+
+Each database size is measured in a fresh child process, because the app
+reads DATABASE_PATH when it is imported.
+
+Usage:
+    python benchmark.py [--sizes 1000,100000,1000000] [--iterations 20]
+                        [--output benchmark-results.json] [--compare old-results.json]
+                        [--keep-databases DIR]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from generate_data import DataGenerator
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class Benchmark:
+    """One timed operation: run(args) is timed, setup(i) prepares its arguments untimed"""
+
+    def __init__(self, name, run, setup=None, iterations=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda i: None)
+        self.iterations = iterations
+
+def measure(benchmark, iterations, statements):
+    """Time a benchmark, then run it once more to count statements and peak memory"""
+    counter = itertools.count()
+    benchmark.run(benchmark.setup(next(counter)))  # warm up caches and pooled connections
+
+    timings = []
+    for _ in range(benchmark.iterations or iterations):
+        args = benchmark.setup(next(counter))
+        start = time.perf_counter()
+        benchmark.run(args)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    args = benchmark.setup(next(counter))
+    statements[0] = 0
+    tracemalloc.start()
+    benchmark.run(args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'name': benchmark.name,
+        'iterations': len(timings),
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': statements[0],
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+def model_benchmarks(app_module, rng, words):
+    """Benchmarks for every Category, Flashcard and StudyStats method"""
+    from models import encode_page_cursor
+
+    categories = app_module.category_model
+    flashcards = app_module.flashcard_model
+    conn = sqlite3.connect(os.environ['DATABASE_PATH'])
+    card_ids = [row[0] for row in conn.execute('SELECT id FROM flashcards')]
+    category_ids = [row[0] for row in conn.execute('SELECT id FROM categories')]
+    middle = conn.execute('SELECT created_at, id FROM flashcards ORDER BY created_at LIMIT 1 OFFSET ?',
+                          (len(card_ids) // 2,)).fetchone()
+    conn.close()
+    # Deletions take cards from one half, everything else reads the other half
+    rng.shuffle(card_ids)
+    deletable = iter(card_ids[len(card_ids) // 2:])
+    card_ids = card_ids[:len(card_ids) // 2]
+    names = itertools.count()
+
+    def new_category(i):
+        return categories.add_category(f'bench-category-{next(names)}', '')['id']
+
+    return [
+        Benchmark('Category.get_all_categories', lambda _: categories.get_all_categories()),
+        Benchmark('Category.get_category_by_id',
+                  lambda category_id: categories.get_category_by_id(category_id),
+                  lambda i: rng.choice(category_ids)),
+        Benchmark('Category.get_card_counts', lambda _: categories.get_card_counts()),
+        Benchmark('Category.add_category',
+                  lambda name: categories.add_category(name, 'benchmark'),
+                  lambda i: f'bench-add-{next(names)}'),
+        Benchmark('Category.get_or_create_categories',
+                  lambda batch: categories.get_or_create_categories(batch),
+                  lambda i: [f'Category {j}' for j in range(1, 6)] + [f'bench-bulk-{next(names)}' for _ in range(5)]),
+        Benchmark('Category.update_category',
+                  lambda category_id: categories.update_category(category_id, f'bench-renamed-{next(names)}', ''),
+                  new_category),
+        Benchmark('Category.delete_category', lambda category_id: categories.delete_category(category_id),
+                  new_category),
+
+        Benchmark('Flashcard.get_all_flashcards(limit=30)', lambda _: flashcards.get_all_flashcards(limit=30)),
+        Benchmark('Flashcard.get_all_flashcards(category, limit=30)',
+                  lambda category_id: flashcards.get_all_flashcards(category_id, limit=30),
+                  lambda i: rng.choice(category_ids)),
+        Benchmark('Flashcard.get_all_flashcards()', lambda _: flashcards.get_all_flashcards(), iterations=3),
+        Benchmark('Flashcard.get_recent_flashcards', lambda _: flashcards.get_recent_flashcards(10)),
+        Benchmark('Flashcard.get_flashcards_page(first)', lambda _: flashcards.get_flashcards_page()),
+        Benchmark('Flashcard.get_flashcards_page(middle)',
+                  lambda cursor: flashcards.get_flashcards_page(after=cursor),
+                  lambda i: encode_page_cursor(middle[0], middle[1])),
+        Benchmark('Flashcard.search_flashcards',
+                  lambda word: flashcards.search_flashcards(word),
+                  lambda i: rng.choice(words)),
+        Benchmark('Flashcard.get_flashcard_by_id',
+                  lambda card_id: flashcards.get_flashcard_by_id(card_id),
+                  lambda i: rng.choice(card_ids)),
+        Benchmark('Flashcard.add_flashcard',
+                  lambda category_id: flashcards.add_flashcard('bench front', 'bench back', category_id),
+                  lambda i: rng.choice(category_ids)),
+        Benchmark('Flashcard.add_flashcards(100)',
+                  lambda rows: flashcards.add_flashcards(rows),
+                  lambda i: [(f'bulk front {j}', f'bulk back {j}', rng.choice(category_ids)) for j in range(100)]),
+        Benchmark('Flashcard.update_flashcard',
+                  lambda card_id: flashcards.update_flashcard(card_id, 'updated front', 'updated back',
+                                                              rng.choice(category_ids)),
+                  lambda i: rng.choice(card_ids)),
+        Benchmark('Flashcard.delete_flashcard', lambda card_id: flashcards.delete_flashcard(card_id),
+                  lambda i: next(deletable)),
+        Benchmark('Flashcard.get_cards_for_review', lambda _: flashcards.get_cards_for_review(20)),
+        Benchmark('Flashcard.get_cards_for_review(exclude=100)',
+                  lambda exclude: flashcards.get_cards_for_review(20, exclude),
+                  lambda i: rng.sample(card_ids, min(100, len(card_ids)))),
+        Benchmark('Flashcard.record_review',
+                  lambda card_id: flashcards.record_review(card_id, rng.randint(1, 5)),
+                  lambda i: rng.choice(card_ids)),
+        Benchmark('Flashcard.record_reviews(20)',
+                  lambda reviews: flashcards.record_reviews(reviews),
+                  lambda i: [{'flashcard_id': rng.choice(card_ids), 'rating': rng.randint(1, 5)}
+                             for _ in range(20)]),
+        Benchmark('Flashcard.reschedule_all', lambda _: flashcards.reschedule_all(), iterations=3),
+        Benchmark('StudyStats.get_stats', lambda _: app_module.study_stats.get_stats()),
+    ]
+
+def route_benchmarks(app_module, rng, words):
+    """Benchmarks for every route, through the Flask test client"""
+    from models import encode_page_cursor
+
+    # Without cookies, flashed messages don't pile up in the session between requests
+    client = app_module.app.test_client(use_cookies=False)
+    conn = sqlite3.connect(os.environ['DATABASE_PATH'])
+    card_ids = [row[0] for row in conn.execute('SELECT id FROM flashcards')]
+    category_ids = [row[0] for row in conn.execute("SELECT id FROM categories WHERE name LIKE 'Category %'")]
+    middle = conn.execute('SELECT created_at, id FROM flashcards ORDER BY created_at LIMIT 1 OFFSET ?',
+                          (len(card_ids) // 2,)).fetchone()
+    conn.close()
+    rng.shuffle(card_ids)
+    deletable = iter(card_ids[len(card_ids) // 2:])
+    card_ids = card_ids[:len(card_ids) // 2]
+    names = itertools.count()
+    cursor = encode_page_cursor(middle[0], middle[1])
+
+    def request(method, url, **kwargs):
+        # Consume the body chunk by chunk without keeping it, so streamed
+        # responses are measured the way a real client receives them
+        response = client.open(url, method=method, buffered=False, **kwargs)
+        for _ in response.iter_encoded():
+            pass
+        response.close()
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} returned {response.status_code}')
+        return response
+
+    def get(url):
+        return lambda _: request('GET', url)
+
+    def new_category(i):
+        return app_module.category_model.add_category(f'bench-route-category-{next(names)}', '')['id']
+
+    csv_upload = 'front,back,category\n' + ''.join(f'import front {j},import back {j},Category 1\n'
+                                                  for j in range(100))
+
+    return [
+        Benchmark('GET /', get('/')),
+        Benchmark('GET /categories', get('/categories')),
+        Benchmark('GET /categories/add', get('/categories/add')),
+        Benchmark('POST /categories/add',
+                  lambda name: request('POST', '/categories/add', data={'name': name, 'description': ''}),
+                  lambda i: f'bench-route-add-{next(names)}'),
+        Benchmark('GET /categories/edit/<id>',
+                  lambda category_id: request('GET', f'/categories/edit/{category_id}'),
+                  lambda i: rng.choice(category_ids)),
+        Benchmark('POST /categories/edit/<id>',
+                  lambda category_id: request('POST', f'/categories/edit/{category_id}',
+                                              data={'name': f'bench-route-renamed-{next(names)}',
+                                                    'description': ''}),
+                  new_category),
+        Benchmark('POST /categories/delete/<id>',
+                  lambda category_id: request('POST', f'/categories/delete/{category_id}'),
+                  new_category),
+        Benchmark('GET /flashcards', get('/flashcards')),
+        Benchmark('GET /flashcards (304)',
+                  lambda etag: client.get('/flashcards', headers={'If-None-Match': etag}),
+                  lambda i: request('GET', '/flashcards').headers['ETag']),
+        Benchmark('GET /flashcards?category_id',
+                  lambda category_id: request('GET', f'/flashcards?category_id={category_id}'),
+                  lambda i: rng.choice(category_ids)),
+        Benchmark('GET /flashcards/search',
+                  lambda word: request('GET', f'/flashcards/search?q={word}'),
+                  lambda i: rng.choice(words)),
+        Benchmark('GET /flashcards/add', get('/flashcards/add')),
+        Benchmark('POST /flashcards/add',
+                  lambda category_id: request('POST', '/flashcards/add',
+                                              data={'front_content': 'route front', 'back_content': 'route back',
+                                                    'category_id': str(category_id)}),
+                  lambda i: rng.choice(category_ids)),
+        Benchmark('GET /flashcards/import', get('/flashcards/import')),
+        Benchmark('POST /flashcards/import (100 rows)',
+                  lambda _: request('POST', '/flashcards/import',
+                                    data={'file': (io.BytesIO(csv_upload.encode('utf-8')), 'deck.csv')})),
+        Benchmark('GET /flashcards/export (csv)', get('/flashcards/export?format=csv'), iterations=3),
+        Benchmark('GET /flashcards/export (jsonl, reviews)', get('/flashcards/export?format=jsonl&reviews=1'),
+                  iterations=3),
+        Benchmark('GET /flashcards/edit/<id>',
+                  lambda card_id: request('GET', f'/flashcards/edit/{card_id}'),
+                  lambda i: rng.choice(card_ids)),
+        Benchmark('POST /flashcards/edit/<id>',
+                  lambda card_id: request('POST', f'/flashcards/edit/{card_id}',
+                                          data={'front_content': 'edited front', 'back_content': 'edited back',
+                                                'category_id': str(rng.choice(category_ids))}),
+                  lambda i: rng.choice(card_ids)),
+        Benchmark('POST /flashcards/delete/<id>',
+                  lambda card_id: request('POST', f'/flashcards/delete/{card_id}'),
+                  lambda i: next(deletable)),
+        Benchmark('GET /review', get('/review')),
+        Benchmark('GET /api/review/next', get('/api/review/next')),
+        Benchmark('POST /review/record',
+                  lambda card_id: request('POST', '/review/record',
+                                          data={'flashcard_id': card_id, 'rating': rng.randint(1, 5)}),
+                  lambda i: rng.choice(card_ids)),
+        Benchmark('POST /review/record-batch (20)',
+                  lambda reviews: request('POST', '/review/record-batch', json={'reviews': reviews}),
+                  lambda i: [{'flashcard_id': rng.choice(card_ids), 'rating': rng.randint(1, 5)}
+                             for _ in range(20)]),
+        Benchmark('GET /stats', get('/stats')),
+        Benchmark('GET /api/stats', get('/api/stats')),
+        Benchmark('GET /api/flashcards', get(f'/api/flashcards?cursor={cursor}')),
+        Benchmark('GET /api/flashcards (html)', get(f'/api/flashcards?cursor={cursor}&format=html')),
+        Benchmark('GET /api/flashcards/<id>',
+                  lambda card_id: request('GET', f'/api/flashcards/{card_id}'),
+                  lambda i: rng.choice(card_ids)),
+        Benchmark('GET /metrics', get('/metrics')),
+    ]
+
+def run_child(args):
+    """Build (if needed) and benchmark one database, writing results to args.result"""
+    generator = DataGenerator(seed=args.seed)
+    build_seconds = None
+    if not os.path.exists(args.pristine):
+        start = time.perf_counter()
+        generator.generate(args.pristine, cards=args.cards, reviews=args.cards * 3)
+        build_seconds = round(time.perf_counter() - start, 2)
+    shutil.copyfile(args.pristine, args.database)
+    os.environ['DATABASE_PATH'] = args.database
+    os.environ['METRICS_DIR'] = os.path.join(os.path.dirname(args.database), 'metrics')
+    import schema
+    schema.DATABASE_PATH = args.database
+
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as app_module
+
+    # Count the statements the app issues on its connection pool (an
+    # executemany counts once; statements run by triggers and by the FTS5
+    # extension internally are not counted)
+    statements = [0]
+
+    def count_statement(sql, parameters, seconds):
+        statements[0] += 1
+
+    app_module.db_manager.add_query_listener(count_statement)
+
+    conn = sqlite3.connect(args.database)
+    run = {
+        'cards': conn.execute('SELECT COUNT(*) FROM flashcards').fetchone()[0],
+        'reviews': conn.execute('SELECT COUNT(*) FROM review_history').fetchone()[0],
+        'database_bytes': os.path.getsize(args.database),
+        'build_seconds': build_seconds,
+        'results': [],
+    }
+    conn.close()
+
+    # Search for the most frequent words of the generated vocabulary
+    search_words = generator.vocabulary[:50]
+
+    # Route benchmarks are set up after the model ones ran, so they only pick
+    # cards that still exist
+    rng = random.Random(args.seed)
+    benchmarks = []
+    for make_benchmarks in (model_benchmarks, route_benchmarks):
+        for benchmark in make_benchmarks(app_module, rng, search_words):
+            result = measure(benchmark, args.iterations, statements)
+            print(f"  {benchmark.name:<50} p50 {result['p50_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms  "
+                  f"{result['queries']:>5} queries  {result['peak_memory_kb']:>9.1f} KB", file=sys.stderr)
+            run['results'].append(result)
+            benchmarks.append(benchmark)
+
+    # Routes nobody wrote a benchmark for, so the suite can't silently fall behind the app
+    covered = {benchmark.name.split(' ')[1] for benchmark in benchmarks if benchmark.name.split(' ')[0] in
+               ('GET', 'POST')}
+    run['uncovered_routes'] = sorted(
+        rule.rule for rule in app_module.app.url_map.iter_rules()
+        if rule.endpoint != 'static' and
+        rule.rule.replace('<int:flashcard_id>', '<id>').replace('<int:category_id>', '<id>') not in covered)
+
+    with open(args.result, 'w') as f:
+        json.dump(run, f)
+
+def compare(results, baseline):
+    """Print p50 changes against a previous results file"""
+    previous = {(run['cards'], result['name']): result
+                for run in baseline['runs'] for result in run['results']}
+    for run in results['runs']:
+        print(f"\n{run['cards']} cards: p50 vs baseline")
+        for result in run['results']:
+            before = previous.get((run['cards'], result['name']))
+            if before and before['p50_ms']:
+                ratio = result['p50_ms'] / before['p50_ms']
+                print(f"  {result['name']:<50} {before['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ms  ({ratio:.2f}x)")
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark models and routes on synthetic databases')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma-separated card counts (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed runs per operation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--keep-databases', metavar='DIR',
+                        help='Keep built databases in DIR and reuse them on later runs')
+    # Internal: benchmark one database in this process
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--pristine', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    parser.add_argument('--cards', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    # Read the baseline first, so --compare may name the file being overwritten
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'seed': args.seed,
+        'runs': [],
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in (int(size) for size in args.sizes.split(',')):
+            # Benchmarks write to the database, so every run works on a copy
+            # of the freshly built (or kept) one
+            database_dir = args.keep_databases or workdir
+            os.makedirs(database_dir, exist_ok=True)
+            pristine = os.path.join(database_dir, f'benchmark-{size}-seed{args.seed}.db')
+            result_path = os.path.join(workdir, f'result-{size}.json')
+
+            print(f'{size} cards', file=sys.stderr)
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--child',
+                            '--pristine', pristine, '--database', os.path.join(workdir, f'run-{size}.db'),
+                            '--cards', str(size), '--iterations', str(args.iterations),
+                            '--seed', str(args.seed), '--result', result_path], check=True)
+            with open(result_path) as f:
+                results['runs'].append(json.load(f))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}', file=sys.stderr)
+
+    if baseline:
+        compare(results, baseline)
+
+if __name__ == '__main__':
+    main()
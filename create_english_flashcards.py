@@ -36,15 +36,15 @@ def create_category_if_not_exists(category_name):
     conn.close()
     return category_id
 
-def add_flashcard(category_id, front, back):
-    """Adiciona um flashcard ao banco de dados"""
+def add_flashcards(category_id, flashcards):
+    """Adiciona os flashcards ao banco de dados em uma única transação"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
+    cursor.executemany('''
         INSERT INTO flashcards (category_id, front_content, back_content, difficulty_level, review_count)
         VALUES (?, ?, ?, 1, 0)
-    ''', (category_id, front, back))
+    ''', [(category_id, front, back) for front, back in flashcards])
     
     conn.commit()
     conn.close()
@@ -179,8 +179,8 @@ def create_english_flashcards():
     
     print(f"Criando {len(all_flashcards)} flashcards na categoria 'English Class'...")
     
+    add_flashcards(category_id, all_flashcards)
     for front, back in all_flashcards:
-        add_flashcard(category_id, front, back)
         print(f"✓ Adicionado: {front}")
     
     print(f"\n🎉 Sucesso! {len(all_flashcards)} flashcards criados!")
@@ -0,0 +1,124 @@
+"""Set-based bulk content patches for flashcards
+
+A patch maps values of one column (front_content by default) to new values
+for a target column. The mapping is loaded into a temporary table and
+applied with a single UPDATE joined against it, in one transaction, so a
+patch costs one pass however many entries it has.
+
+Usage:
+    python deck_patch.py patch.json [--match front_content] [--set back_content]
+                         [--category "English Class"] [--dry-run]
+
+The patch file is a JSON object ({"old value": "new value", ...}) or a CSV
+file with two columns (match value, new value) and no header.
+"""
+
+import argparse
+import csv
+import json
+
+from models import DatabaseManager
+
+class DeckPatch:
+    """Apply {match value: new value} mappings to the flashcards table"""
+
+    COLUMNS = ('front_content', 'back_content')
+
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or DatabaseManager()
+
+    def apply(self, mapping, match_column='front_content', set_column='back_content',
+              category_name=None, dry_run=False):
+        """Apply a patch, returning the rows changed and a diff of (id, old, new)
+
+        With dry_run the diff is computed and the transaction rolled back.
+        """
+        if match_column not in self.COLUMNS or set_column not in self.COLUMNS:
+            raise ValueError(f'Patch columns must be one of {", ".join(self.COLUMNS)}')
+
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('DROP TABLE IF EXISTS temp.deck_patch')
+            cursor.execute('''
+                CREATE TEMP TABLE deck_patch (
+                    match_value TEXT PRIMARY KEY,
+                    new_value TEXT NOT NULL
+                )
+            ''')
+            cursor.executemany('INSERT OR REPLACE INTO temp.deck_patch (match_value, new_value) VALUES (?, ?)',
+                               mapping.items())
+
+            category_filter = ''
+            params = []
+            if category_name is not None:
+                category_filter = 'AND {table}.category_id = (SELECT id FROM categories WHERE name = ?)'
+                params.append(category_name)
+
+            # Rows that would change, driven from the patch table through the
+            # front_content index rather than one scan per entry
+            cursor.execute(f'''
+                SELECT f.id, f.{match_column} AS match_value, f.{set_column} AS old_value, p.new_value
+                FROM temp.deck_patch p
+                JOIN flashcards f ON f.{match_column} = p.match_value
+                WHERE f.{set_column} IS NOT p.new_value {category_filter.format(table='f')}
+                ORDER BY f.id
+            ''', params)
+            changes = [dict(row) for row in cursor.fetchall()]
+
+            rows_changed = 0
+            if changes and not dry_run:
+                cursor.execute(f'''
+                    UPDATE flashcards
+                    SET {set_column} = (SELECT new_value FROM temp.deck_patch p
+                                        WHERE p.match_value = flashcards.{match_column})
+                    WHERE {match_column} IN (SELECT match_value FROM temp.deck_patch)
+                    AND {set_column} IS NOT (SELECT new_value FROM temp.deck_patch p
+                                             WHERE p.match_value = flashcards.{match_column})
+                    {category_filter.format(table='flashcards')}
+                ''', params)
+                rows_changed = cursor.rowcount
+                conn.commit()
+            else:
+                conn.rollback()
+
+            cursor.execute('DROP TABLE IF EXISTS temp.deck_patch')
+        return {'success': True,
+                'rows_changed': len(changes) if dry_run else rows_changed,
+                'dry_run': dry_run,
+                'changes': changes}
+
+def format_diff(changes, column):
+    """Render a patch diff as '- old' / '+ new' lines per flashcard"""
+    lines = []
+    for change in changes:
+        lines.append(f"@@ flashcard {change['id']}: {change['match_value']}")
+        lines.append(f"- {column}: {change['old_value']}")
+        lines.append(f"+ {column}: {change['new_value']}")
+    return '\n'.join(lines)
+
+def load_mapping(path):
+    """Load a patch mapping from a JSON object or a two-column CSV file"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.json'):
+            return json.load(f)
+        return {row[0]: row[1] for row in csv.reader(f) if len(row) >= 2}
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply a bulk content patch to flashcards')
+    parser.add_argument('path')
+    parser.add_argument('--match', default='front_content', choices=DeckPatch.COLUMNS)
+    parser.add_argument('--set', dest='set_column', default='back_content', choices=DeckPatch.COLUMNS)
+    parser.add_argument('--category', help='Only patch flashcards in this category')
+    parser.add_argument('--dry-run', action='store_true', help='Show the diff without changing anything')
+    args = parser.parse_args()
+
+    result = DeckPatch().apply(load_mapping(args.path), args.match, args.set_column,
+                               args.category, args.dry_run)
+    if result['changes']:
+        print(format_diff(result['changes'], args.set_column))
+    verb = 'would change' if args.dry_run else 'changed'
+    print(f"{result['rows_changed']} flashcards {verb}.")
+
+if __name__ == '__main__':
+    main()
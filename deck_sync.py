@@ -0,0 +1,149 @@
+"""Content-hash based incremental deck sync
+
+A deck is a named list of (category, front, back) cards, such as the decks
+shipped by the deploy scripts. Each card is identified by a hash of its
+normalized category and front text and fingerprinted by a hash of its
+normalized back text. The hashes written by the last sync are kept in the
+deck_manifest table, so a sync only inserts, updates or deletes the cards
+that changed since, all in a single transaction. Cards the deck never
+created are left alone.
+
+Usage:
+    python deck_sync.py deck.csv --deck english-class [--no-prune] [--dry-run]
+"""
+
+import argparse
+import hashlib
+import re
+import unicodedata
+
+from importer import detect_format, iter_cards, FORMATS
+from models import DatabaseManager
+
+def normalize(text):
+    """Normalize text for hashing: Unicode NFC, trimmed, single spaces"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text or '')).strip()
+
+def content_hash(*parts):
+    """Stable hash of normalized text parts"""
+    joined = '\x1f'.join(normalize(part) for part in parts)
+    return hashlib.sha256(joined.encode('utf-8')).hexdigest()
+
+class DeckSync:
+    """Sync a named deck of cards into the flashcards table using a hash manifest"""
+
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or DatabaseManager()
+
+    def sync(self, deck, cards, prune=True, dry_run=False):
+        """Sync (category name, front, back) cards for a deck
+
+        Cards whose key is new are inserted (or adopted, if an identical front
+        already exists in the category), cards whose back changed are updated
+        and, with prune, cards the deck created earlier but no longer lists are
+        deleted together with their review history.
+        """
+        desired = {}
+        for category, front, back in cards:
+            desired[content_hash(category or '', front)] = (category, front, back, content_hash(back))
+
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+
+            # Previous manifest; a missing flashcard means it was deleted by hand
+            cursor.execute('''
+                SELECT m.card_key, m.content_hash, m.flashcard_id, f.id IS NOT NULL AS present
+                FROM deck_manifest m
+                LEFT JOIN flashcards f ON f.id = m.flashcard_id
+                WHERE m.deck = ?
+            ''', (deck,))
+            manifest = {row['card_key']: row for row in cursor.fetchall()}
+
+            inserts = [key for key in desired if key not in manifest or not manifest[key]['present']]
+            updates = [key for key in desired
+                       if key in manifest and manifest[key]['present']
+                       and manifest[key]['content_hash'] != desired[key][3]]
+            deletes = [key for key in manifest if key not in desired] if prune else []
+
+            result = {'success': True, 'dry_run': dry_run, 'inserted': len(inserts), 'updated': len(updates),
+                      'deleted': len(deletes), 'unchanged': len(desired) - len(inserts) - len(updates)}
+            if dry_run or not (inserts or updates or deletes):
+                return result
+
+            # Resolve categories once, creating missing ones in the same transaction
+            names = {desired[key][0] for key in inserts if desired[key][0]}
+            cursor.executemany('INSERT OR IGNORE INTO categories (name, description) VALUES (?, ?)',
+                               [(name, '') for name in names])
+            category_ids = {}
+            for name in names:
+                cursor.execute('SELECT id FROM categories WHERE name = ?', (name,))
+                category_ids[name] = cursor.fetchone()[0]
+
+            manifest_rows = []
+            for key in inserts:
+                category, front, back, back_hash = desired[key]
+                category_id = category_ids.get(category)
+                # Adopt a matching card created before the deck was managed by sync
+                cursor.execute('''
+                    SELECT id, back_content FROM flashcards
+                    WHERE front_content = ? AND category_id IS ?
+                    AND id NOT IN (SELECT flashcard_id FROM deck_manifest WHERE deck = ?)
+                    LIMIT 1
+                ''', (front, category_id, deck))
+                existing = cursor.fetchone()
+                if existing:
+                    flashcard_id = existing['id']
+                    if content_hash(existing['back_content']) != back_hash:
+                        cursor.execute('UPDATE flashcards SET back_content = ? WHERE id = ?', (back, flashcard_id))
+                else:
+                    cursor.execute('''
+                        INSERT INTO flashcards (category_id, front_content, back_content)
+                        VALUES (?, ?, ?)
+                    ''', (category_id, front, back))
+                    flashcard_id = cursor.lastrowid
+                manifest_rows.append((deck, key, back_hash, flashcard_id))
+
+            cursor.executemany('UPDATE flashcards SET back_content = ? WHERE id = ?',
+                               [(desired[key][2], manifest[key]['flashcard_id']) for key in updates])
+            manifest_rows.extend((deck, key, desired[key][3], manifest[key]['flashcard_id']) for key in updates)
+
+            deleted_ids = [(manifest[key]['flashcard_id'],) for key in deletes]
+            cursor.executemany('DELETE FROM review_history WHERE flashcard_id = ?', deleted_ids)
+            cursor.executemany('DELETE FROM flashcards WHERE id = ?', deleted_ids)
+            cursor.executemany('DELETE FROM deck_manifest WHERE deck = ? AND card_key = ?',
+                               [(deck, key) for key in deletes])
+
+            cursor.executemany('''
+                INSERT OR REPLACE INTO deck_manifest (deck, card_key, content_hash, flashcard_id)
+                VALUES (?, ?, ?, ?)
+            ''', manifest_rows)
+
+            conn.commit()
+        return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync a CSV or JSONL deck into the database')
+    parser.add_argument('path')
+    parser.add_argument('--deck', required=True, help='Name the deck is tracked under')
+    parser.add_argument('--format', choices=FORMATS, help='Deck format (default: from file extension)')
+    parser.add_argument('--category', help='Category for rows that do not name one')
+    parser.add_argument('--no-prune', dest='prune', action='store_false',
+                        help='Keep cards that were removed from the deck')
+    parser.add_argument('--dry-run', action='store_true', help='Report changes without applying them')
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8-sig', newline='') as stream:
+        cards = []
+        for line_number, row in iter_cards(stream, args.format or detect_format(args.path), args.category):
+            if isinstance(row, str):
+                print(f'Line {line_number}: {row}')
+            else:
+                cards.append(row)
+
+    result = DeckSync().sync(args.deck, cards, prune=args.prune, dry_run=args.dry_run)
+    prefix = 'Would apply' if args.dry_run else 'Applied'
+    print(f"{prefix}: {result['inserted']} inserted, {result['updated']} updated, "
+          f"{result['deleted']} deleted, {result['unchanged']} unchanged.")
+
+if __name__ == '__main__':
+    main()
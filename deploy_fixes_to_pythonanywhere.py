@@ -8,6 +8,9 @@ Este script deve ser executado no console do PythonAnywhere
 import sqlite3
 import os
 
+from deck_patch import DeckPatch
+from models import DatabaseManager
+
 def connect_to_database():
     """Conecta ao banco de dados SQLite"""
     db_path = 'flashcards.db'
@@ -34,7 +37,7 @@ def check_current_translations():
         
         # Busca algumas traduções para verificar o estado atual
         cursor.execute("""
-            SELECT f.front, f.back 
+            SELECT f.front_content, f.back_content 
             FROM flashcards f
             JOIN categories c ON f.category_id = c.id
             WHERE c.name = 'English Class'
@@ -56,7 +59,7 @@ def check_current_translations():
             FROM flashcards f
             JOIN categories c ON f.category_id = c.id
             WHERE c.name = 'English Class'
-            AND LENGTH(f.back) < 20
+            AND LENGTH(f.back_content) < 20
         """)
         
         short_translations = cursor.fetchone()[0]
@@ -159,37 +162,18 @@ def apply_translation_fixes():
     }
     
     try:
-        cursor = conn.cursor()
-        updates_made = 0
-        
         print("\n🔄 Aplicando correções de tradução...")
         print("-" * 50)
         
-        for front_text, correct_translation in correct_translations.items():
-            # Verifica se o flashcard existe e precisa de correção
-            cursor.execute("""
-                SELECT f.id, f.back 
-                FROM flashcards f
-                JOIN categories c ON f.category_id = c.id
-                WHERE c.name = 'English Class' AND f.front = ?
-            """, (front_text,))
-            
-            result = cursor.fetchone()
-            if result:
-                flashcard_id, current_translation = result
-                
-                # Só atualiza se a tradução atual for diferente da correta
-                if current_translation != correct_translation:
-                    cursor.execute("""
-                        UPDATE flashcards 
-                        SET back = ? 
-                        WHERE id = ?
-                    """, (correct_translation, flashcard_id))
-                    
-                    updates_made += 1
-                    print(f"✅ Atualizado: {front_text[:50]}...")
+        # Aplica todas as correções em uma única transação; só altera os
+        # flashcards cuja tradução atual é diferente da correta
+        patch = DeckPatch(DatabaseManager('flashcards.db'))
+        result = patch.apply(correct_translations, match_column='front_content',
+                             set_column='back_content', category_name='English Class')
         
-        conn.commit()
+        for change in result['changes']:
+            print(f"✅ Atualizado: {change['match_value'][:50]}...")
+        updates_made = result['rows_changed']
         
         print(f"\n🎉 Correções aplicadas com sucesso!")
         print(f"📊 Total de flashcards atualizados: {updates_made}")
@@ -199,7 +183,6 @@ def apply_translation_fixes():
         
     except Exception as e:
         print(f"❌ Erro ao aplicar correções: {e}")
-        conn.rollback()
     finally:
         conn.close()
 
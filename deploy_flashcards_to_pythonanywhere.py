@@ -1,5 +1,9 @@
 import sqlite3
-import os
+import sys
+
+from deck_sync import DeckSync
+from models import DatabaseManager
+from schema import initialize_database
 
 def get_db_connection():
     """Conecta ao banco de dados SQLite"""
@@ -28,38 +32,13 @@ def create_category_if_not_exists(category_name, description=""):
     conn.close()
     return category_id
 
-def add_flashcard_if_not_exists(category_id, front_content, back_content):
-    """Adiciona um flashcard se ele não existir"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Verifica se o flashcard já existe
-    cursor.execute('''
-        SELECT id FROM flashcards 
-        WHERE category_id = ? AND front_content = ?
-    ''', (category_id, front_content))
-    
-    existing = cursor.fetchone()
-    
-    if not existing:
-        cursor.execute('''
-            INSERT INTO flashcards (category_id, front_content, back_content, difficulty_level, review_count)
-            VALUES (?, ?, ?, 1, 0)
-        ''', (category_id, front_content, back_content))
-        print(f"✓ Adicionado: {front_content}")
-        added = True
-    else:
-        print(f"- Já existe: {front_content}")
-        added = False
-    
-    conn.commit()
-    conn.close()
-    return added
-
-def deploy_all_flashcards():
+def deploy_all_flashcards(dry_run=False):
     """Implanta todos os flashcards com contexto no PythonAnywhere"""
     print("🚀 Iniciando implantação dos flashcards no PythonAnywhere...")
     
+    # Garante que o esquema (incluindo o manifesto do deck) está atualizado
+    initialize_database()
+    
     # Criar categoria
     category_id = create_category_if_not_exists(
         "English Class", 
@@ -170,25 +149,24 @@ def deploy_all_flashcards():
         ("The project is on track to be completed ahead of schedule", "O projeto está no caminho certo para ser concluído antes do prazo")
     ]
     
-    print(f"\n📚 Adicionando {len(flashcards)} flashcards...")
+    print(f"\n📚 Sincronizando {len(flashcards)} flashcards...")
     
-    added_count = 0
-    for front, back in flashcards:
-        if add_flashcard_if_not_exists(category_id, front, back):
-            added_count += 1
+    # Compara os hashes com o manifesto da última implantação e aplica apenas
+    # as inserções, atualizações e remoções necessárias, em uma única transação
+    deck_sync = DeckSync(DatabaseManager('flashcards.db'))
+    result = deck_sync.sync('english-class-context',
+                            [("English Class", front, back) for front, back in flashcards],
+                            dry_run=dry_run)
     
-    print(f"\n🎉 Implantação concluída!")
+    print(f"\n🎉 Implantação concluída!" if not dry_run else f"\n🔍 Simulação concluída!")
     print(f"📊 Estatísticas:")
     print(f"   • Total de flashcards: {len(flashcards)}")
-    print(f"   • Novos flashcards adicionados: {added_count}")
-    print(f"   • Flashcards já existentes: {len(flashcards) - added_count}")
-    
-    if added_count > 0:
-        print(f"\n✅ {added_count} novos flashcards foram adicionados ao banco de dados!")
-    else:
-        print(f"\n✅ Todos os flashcards já estavam no banco de dados!")
+    print(f"   • Novos flashcards adicionados: {result['inserted']}")
+    print(f"   • Flashcards atualizados: {result['updated']}")
+    print(f"   • Flashcards removidos: {result['deleted']}")
+    print(f"   • Flashcards sem alterações: {result['unchanged']}")
     
     print(f"\n🔗 Agora você pode acessar sua aplicação no PythonAnywhere e ver todos os flashcards contextualizados!")
 
 if __name__ == "__main__":
-    deploy_all_flashcards()
\ No newline at end of file
+    deploy_all_flashcards(dry_run='--dry-run' in sys.argv)
\ No newline at end of file
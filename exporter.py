@@ -0,0 +1,166 @@
+"""Streaming export of flashcard decks and review history as CSV or JSONL
+
+Cards are read from a single cursor with fetchmany and written out chunk by
+chunk, so an export holds one chunk in memory however large the deck is.
+The front, back and category columns are the ones importer.py reads, so an
+export without reviews can be imported again.
+
+With review history, CSV exports have one row per review (cards never
+reviewed get one row with empty review columns) and JSONL exports nest a
+"reviews" list in each card.
+
+Usage:
+    DATABASE_PATH=flashcards.db python exporter.py deck.csv [--category "English Class"] [--reviews]
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+
+from importer import FORMATS, detect_format
+from models import DatabaseManager
+
+CARD_FIELDS = ('id', 'category', 'front', 'back', 'created_at', 'last_reviewed', 'review_count',
+               'next_due_at')
+REVIEW_FIELDS = ('reviewed_at', 'rating')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+def iter_csv(cards, include_reviews=False, chunk_size=1000):
+    """Yield CSV text for card dicts, one chunk per chunk_size cards"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CARD_FIELDS + (REVIEW_FIELDS if include_reviews else ()))
+    for count, card in enumerate(cards, 1):
+        values = [card[field] for field in CARD_FIELDS]
+        if include_reviews:
+            for review in card['reviews'] or [{'reviewed_at': None, 'rating': None}]:
+                writer.writerow(values + [review['reviewed_at'], review['rating']])
+        else:
+            writer.writerow(values)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def iter_jsonl(cards, chunk_size=1000):
+    """Yield JSONL text for card dicts, one chunk per chunk_size cards"""
+    lines = []
+    for card in cards:
+        lines.append(json.dumps(card, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+class DeckExporter:
+    """Stream flashcards and their review history out of the database"""
+
+    def __init__(self, db_manager=None, chunk_size=1000):
+        self.db_manager = db_manager or DatabaseManager()
+        self.chunk_size = chunk_size
+
+    def iter_cards(self, category_id=None, include_reviews=False):
+        """Yield card dicts, oldest first, reading chunk_size rows at a time
+
+        With include_reviews every card has a 'reviews' list, oldest first.
+        The pooled connection is held until the generator is exhausted or closed.
+        """
+        conn = self.db_manager.get_connection()
+        try:
+            cursor = conn.cursor()
+            where = ''
+            params = []
+            if category_id is not None:
+                where = 'WHERE f.category_id = ?'
+                params.append(category_id)
+
+            review_columns = review_join = review_order = ''
+            if include_reviews:
+                review_columns = ', r.reviewed_at, r.performance_rating AS rating'
+                review_join = 'LEFT JOIN review_history r ON r.flashcard_id = f.id'
+                review_order = ', r.id'
+
+            # Ordered along the created_at indexes, so SQLite streams rows
+            # instead of sorting the whole result first
+            cursor.execute(f'''
+                SELECT f.id, c.name AS category, f.front_content AS front, f.back_content AS back,
+                       f.created_at, f.last_reviewed, f.review_count, f.next_due_at{review_columns}
+                FROM flashcards f
+                LEFT JOIN categories c ON f.category_id = c.id
+                {review_join}
+                {where}
+                ORDER BY f.created_at, f.id{review_order}
+            ''', params)
+
+            card = None
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    if not include_reviews:
+                        yield {field: row[field] for field in CARD_FIELDS}
+                        continue
+                    # A card's reviews arrive on consecutive rows
+                    if card is None or card['id'] != row['id']:
+                        if card is not None:
+                            yield card
+                        card = {field: row[field] for field in CARD_FIELDS}
+                        card['reviews'] = []
+                    if row['reviewed_at'] is not None:
+                        card['reviews'].append({'reviewed_at': row['reviewed_at'], 'rating': row['rating']})
+            if card is not None:
+                yield card
+        finally:
+            self.db_manager.close_connection(conn)
+
+    def export(self, fmt='csv', category_id=None, include_reviews=False):
+        """Return a generator of text chunks for a CSV or JSONL export"""
+        cards = self.iter_cards(category_id, include_reviews)
+        if fmt == 'csv':
+            return iter_csv(cards, include_reviews, self.chunk_size)
+        if fmt == 'jsonl':
+            return iter_jsonl(cards, self.chunk_size)
+        raise ValueError(f'Unknown format: {fmt}')
+
+def main():
+    from models import Category
+    from schema import initialize_database
+
+    parser = argparse.ArgumentParser(description='Export flashcards to a CSV or JSONL file')
+    parser.add_argument('path', help="Output file, or - for standard output")
+    parser.add_argument('--format', choices=FORMATS, help='Export format (default: from file extension)')
+    parser.add_argument('--category', help='Only export flashcards in this category')
+    parser.add_argument('--reviews', action='store_true', help='Include review history')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    # Uses DATABASE_PATH like the app does
+    initialize_database()
+
+    category_id = None
+    if args.category:
+        categories = {row['name']: row['id'] for row in Category().get_all_categories()}
+        if args.category not in categories:
+            parser.error(f'Unknown category: {args.category}')
+        category_id = categories[args.category]
+
+    fmt = args.format or detect_format(args.path)
+    chunks = DeckExporter(chunk_size=args.chunk_size).export(fmt, category_id, args.reviews)
+    if args.path == '-':
+        sys.stdout.writelines(chunks)
+    else:
+        with open(args.path, 'w', encoding='utf-8', newline='') as f:
+            f.writelines(chunks)
+
+if __name__ == '__main__':
+    main()
@@ -5,18 +5,13 @@ Script para corrigir as traduções dos flashcards em inglês
 Traduz as frases completas contextualizadas para português brasileiro
 """
 
-import sqlite3
-import os
+import sys
 
-def get_db_connection():
-    """Conecta ao banco de dados SQLite"""
-    return sqlite3.connect('flashcards.db')
+from deck_patch import DeckPatch, format_diff
+from models import DatabaseManager
 
-def fix_flashcard_translations():
+def fix_flashcard_translations(dry_run=False):
     """Corrige as traduções dos flashcards para português brasileiro"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Dicionário com as traduções corretas das frases completas
     correct_translations = {
         # Phrasal Verbs com contexto
@@ -128,28 +123,23 @@ def fix_flashcard_translations():
     
     print("🔄 Corrigindo traduções dos flashcards...")
     
-    updated_count = 0
+    # Aplica todas as traduções de uma vez, em uma única transação
+    patch = DeckPatch(DatabaseManager('flashcards.db'))
+    result = patch.apply(correct_translations, match_column='front_content', set_column='back_content',
+                         category_name='English Class', dry_run=dry_run)
     
-    for front_content, correct_translation in correct_translations.items():
-        # Atualiza a tradução do flashcard
-        cursor.execute('''
-            UPDATE flashcards 
-            SET back_content = ?
-            WHERE front_content = ? AND category_id = (
-                SELECT id FROM categories WHERE name = 'English Class'
-            )
-        ''', (correct_translation, front_content))
-        
-        if cursor.rowcount > 0:
-            updated_count += 1
-            print(f"✓ Atualizado: {front_content[:50]}...")
+    if dry_run:
+        print(format_diff(result['changes'], 'back_content'))
+        print(f"\n🔍 Simulação: {result['rows_changed']} flashcards seriam corrigidos.")
+        return
     
-    conn.commit()
-    conn.close()
+    for change in result['changes']:
+        print(f"✓ Atualizado: {change['match_value'][:50]}...")
+    updated_count = result['rows_changed']
     
     print(f"\n🎉 Correção concluída!")
     print(f"📊 {updated_count} flashcards tiveram suas traduções corrigidas.")
     print(f"\n✅ Agora todas as frases em inglês têm traduções completas e corretas em português!")
 
 if __name__ == "__main__":
-    fix_flashcard_translations()
\ No newline at end of file
+    fix_flashcard_translations(dry_run='--dry-run' in sys.argv)
\ No newline at end of file
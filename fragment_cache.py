@@ -0,0 +1,97 @@
+"""In-process LRU cache for rendered HTML fragments
+
+Fragments such as one flashcard in the card grid are stored under a
+(kind, id) key together with a fingerprint of the data they were rendered
+from. A lookup only hits when the fingerprint still matches, so a fragment
+rendered before a change in another worker process is never served; the
+model write methods also evict entries eagerly in the process that made
+the change. The least recently used fragments are evicted once the cache
+holds more than its memory budget.
+
+Configuration (environment variables):
+    FRAGMENT_CACHE_BYTES    memory budget in bytes (default 8 MiB, 0 disables the cache)
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments bounded by approximate memory use"""
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (kind, id) -> (fingerprint, html, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """Create a cache sized by FRAGMENT_CACHE_BYTES"""
+        return cls(int(os.environ.get('FRAGMENT_CACHE_BYTES', 8 * 1024 * 1024)))
+
+    def get_or_render(self, kind, key, fingerprint, render):
+        """Return the cached fragment for (kind, key) or render and store it
+
+        fingerprint is any value, compared with ==, that changes when the
+        fragment would render differently; render is called with no arguments.
+        """
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end((kind, key))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Render outside the lock; two threads may render the same fragment once each
+        html = Markup(render())
+        if self.max_bytes > 0:
+            self._store((kind, key), fingerprint, html)
+        return html
+
+    def _store(self, cache_key, fingerprint, html):
+        size = sys.getsizeof(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(cache_key, None)
+            if old is not None:
+                self._size -= old[2]
+            self._entries[cache_key] = (fingerprint, html, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted[2]
+
+    def invalidate(self, kind, key=None, match=None):
+        """Drop the fragment for (kind, key), or every fragment of a kind if key is None
+
+        match, if given, is called with each fingerprint of the kind and only
+        the fragments it returns true for are dropped.
+        """
+        with self._lock:
+            if key is not None:
+                keys = [(kind, key)] if (kind, key) in self._entries else []
+            else:
+                keys = [cache_key for cache_key, entry in self._entries.items()
+                        if cache_key[0] == kind and (match is None or match(entry[0]))]
+            for cache_key in keys:
+                self._size -= self._entries.pop(cache_key)[2]
+
+    def clear(self):
+        """Drop every fragment"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Entry count, approximate bytes used, hits and misses"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size,
+                    'hits': self.hits, 'misses': self.misses}
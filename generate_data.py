@@ -0,0 +1,281 @@
+"""Synthetic data generator for large decks and review histories
+
+Fills a new database with categories, flashcards and review events that
+look like real usage:
+
+- card text is cut at random offsets from a long stream of words drawn
+  from a Zipf-distributed vocabulary, with log-normal word counts (short
+  fronts, longer backs);
+- review events follow an exponential forgetting curve: a review after t
+  days is recalled with probability exp(-t / S), where the memory stability
+  S grows after every successful recall and shrinks after a lapse, and the
+  next review is planned for when recall drops to the target retention
+  (at most 100 years ahead, like the app's schedulers);
+- cards are reviewed roughly on schedule up to the present, so about one
+  in ten reviewed cards is due, as in a deck that is studied regularly.
+
+The same seed and --now always produce the same dataset (--now defaults to
+a fixed date, so pass the current time to get cards due around today), and
+databases can be shared by sharing the command line. Rows are bulk inserted
+into the base tables (the first schema migration), then the remaining
+migrations add the triggers, indexes and full-text index, building each in
+one pass.
+
+Cards store their stability the way FSRSScheduler reads it: days until
+recall drops to 90%.
+
+Usage:
+    python generate_data.py big.db --cards 1000000 --reviews 3000000 \
+        [--categories 20] [--seed 0] [--now EPOCH]
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import time
+
+# Longest word stream card text is cut from; sampling every word separately
+# would dominate the build time of large databases
+STREAM_WORDS = 1 << 22
+
+# Default "now" of generated data (2026-01-01 00:00 UTC), fixed so a seed
+# always produces the same database
+DEFAULT_NOW = 1767225600
+
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ra', 'to', 'su', 'vi', 'de', 'po', 'li', 'an', 'es', 'or', 'ul',
+             'ba', 'che', 'dor', 'fen', 'gar', 'hul', 'jor', 'mar', 'nes', 'qui', 'sol', 'tra', 'ven')
+
+class ForgettingCurve:
+    """Exponential forgetting curve with stability that grows on recall and shrinks on lapses"""
+
+    def __init__(self, initial_stability=1.0, stability_growth=2.5, lapse_factor=0.3,
+                 target_retention=0.9, max_interval=36500):
+        self.initial_stability = initial_stability
+        self.stability_growth = stability_growth
+        self.lapse_factor = lapse_factor
+        self.target_retention = target_retention
+        self.max_interval = max_interval
+        # Stability stops growing once the interval reaches max_interval
+        self.max_stability = max(initial_stability, max_interval / -math.log(target_retention))
+
+    def recall_probability(self, elapsed_days, stability):
+        return math.exp(-elapsed_days / stability)
+
+    def fsrs_stability(self, stability):
+        """Days until recall drops to 90%, which is what FSRS calls stability"""
+        return -stability * math.log(0.9)
+
+    def interval(self, stability):
+        """Days until recall probability falls to the target retention"""
+        return min(-stability * math.log(self.target_retention), self.max_interval)
+
+def make_vocabulary(rng, size):
+    """Distinct pseudo-words of two to four syllables"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def zipf_table(vocabulary, exponent=1.1, size=1 << 20):
+    """Words repeated in proportion to their Zipf frequency, first word most frequent
+
+    Picking uniformly from the table is much faster than weighted sampling.
+    """
+    weights = [1.0 / rank ** exponent for rank in range(1, len(vocabulary) + 1)]
+    scale = size / sum(weights)
+    table = []
+    for word, weight in zip(vocabulary, weights):
+        table.extend([word] * max(1, round(weight * scale)))
+    return table
+
+class DataGenerator:
+    """Deterministic generator of categories, cards and review events"""
+
+    def __init__(self, seed=0, vocabulary_size=20000, days=365, curve=None,
+                 new_fraction=0.2, now=DEFAULT_NOW):
+        self.rng = random.Random(seed)
+        self.vocabulary = make_vocabulary(self.rng, vocabulary_size)
+        self.rng.shuffle(self.vocabulary)
+        self.table = zipf_table(self.vocabulary)
+        self.days = days
+        self.curve = curve or ForgettingCurve()
+        self.new_fraction = new_fraction
+        self.now = now
+        self.stream = []
+
+    def text(self, median_words, sigma, max_words):
+        """A phrase whose word count is log-normally distributed around median_words"""
+        count = max(1, min(max_words, int(math.exp(self.rng.gauss(math.log(median_words), sigma)) + 0.5)))
+        start = int(self.rng.random() * (len(self.stream) - count))
+        return ' '.join(self.stream[start:start + count])
+
+    def review_counts(self, cards, reviews):
+        """Spread the review events over the cards that are not new"""
+        random = self.rng.random
+        reviewed = [card for card in range(cards) if random() >= self.new_fraction]
+        counts = [0] * cards
+        if reviewed:
+            for _ in range(reviews):
+                counts[reviewed[int(random() * len(reviewed))]] += 1
+        return counts
+
+    def simulate(self, created_at, count):
+        """Review times (epoch seconds), ratings and final state for one card"""
+        random = self.rng.random
+        curve = self.curve
+        stability = curve.initial_stability
+        successes = 0
+        offsets = []
+        ratings = []
+        elapsed = 0.0
+        interval = 0.0
+        for _ in range(count):
+            # Reviews happen around the planned time, sometimes late
+            elapsed_since = interval * (0.8 + 0.8 * random()) if offsets else 2 * random()
+            elapsed += elapsed_since
+            recalled = random() < (curve.recall_probability(elapsed_since, stability) if offsets else 0.7)
+            if recalled:
+                # Well established cards are rated higher when recalled
+                successes += 1
+                stability = min(curve.max_stability, stability * curve.stability_growth)
+                ratings.append(3 + int(random() * (3 if stability > 7 else 2)))
+            else:
+                successes = 0
+                stability = max(curve.initial_stability, stability * curve.lapse_factor)
+                ratings.append(1 + int(random() * 2))
+            interval = curve.interval(stability)
+            offsets.append(elapsed)
+
+        # The card is studied on schedule up to now: the last review was a
+        # random part of its interval ago, up to 10% late. A short history
+        # starts after the card was created, a long one is squeezed into the
+        # time since then.
+        span = (self.now - created_at) / 86400
+        last = max(0.0, span - min(span, interval) * 1.1 * random())
+        if offsets and offsets[-1] > last:
+            scale, shift = last / offsets[-1], 0.0
+        else:
+            scale, shift = 1.0, last - (offsets[-1] if offsets else 0.0)
+        times = [created_at + int((offset * scale + shift) * 86400) for offset in offsets]
+        return times, ratings, {'successes': successes, 'stability': curve.fsrs_stability(stability),
+                                'interval': interval}
+
+    def generate(self, path, categories=20, cards=1000, reviews=3000, progress=None):
+        """Create a database at path filled with generated data"""
+        import schema
+
+        # Bulk load into the base tables only, without per-row triggers and
+        # secondary indexes; the remaining migrations run afterwards
+        schema.migrate(path, target=1)
+
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA journal_mode = MEMORY')
+        conn.execute('PRAGMA cache_size = -262144')
+
+        self.stream = self.rng.choices(self.table, k=min(STREAM_WORDS, (cards + categories) * 16 + 200))
+        conn.executemany('INSERT INTO categories (name, description) VALUES (?, ?)',
+                         [(f'Category {i + 1}', self.text(6, 0.5, 20)) for i in range(categories)])
+        category_ids = [row[0] for row in conn.execute('SELECT id FROM categories ORDER BY id')]
+        first_id = (conn.execute('SELECT MAX(id) FROM flashcards').fetchone()[0] or 0) + 1
+
+        counts = self.review_counts(cards, reviews)
+        review_rows = []
+        random = self.rng.random
+        getrandbits = self.rng.getrandbits
+
+        def card_rows():
+            for index in range(cards):
+                created_at = self.now - int(random() * self.days * 86400)
+                front = self.text(3, 0.6, 30)
+                back = self.text(8, 0.8, 120)
+                category_id = category_ids[int(random() * len(category_ids))] if category_ids else None
+                shuffle_key = getrandbits(64) - 2 ** 63
+                if progress and index % 100000 == 0:
+                    progress(index, cards)
+                if not counts[index]:
+                    yield (category_id, front, back, created_at, None, 0, 0, None, None, None, shuffle_key)
+                    continue
+                times, ratings, state = self.simulate(created_at, counts[index])
+                flashcard_id = first_id + index
+                review_rows.extend(zip([flashcard_id] * len(times), ratings, times))
+                last_reviewed = times[-1]
+                yield (category_id, front, back, created_at, last_reviewed, len(times), state['successes'],
+                       last_reviewed + int(state['interval'] * 86400), state['stability'],
+                       state['interval'], shuffle_key)
+
+                # Write review events in batches so memory stays bounded
+                if len(review_rows) >= 100000:
+                    flush_reviews()
+
+        def flush_reviews():
+            conn.executemany('''
+                INSERT INTO review_history (flashcard_id, performance_rating, reviewed_at)
+                VALUES (?, ?, datetime(?, 'unixepoch'))
+            ''', review_rows)
+            review_rows.clear()
+
+        # Timestamps are passed as epoch seconds and formatted by SQLite
+        conn.executemany('''
+            INSERT INTO flashcards (category_id, front_content, back_content, created_at, last_reviewed,
+                                    review_count, difficulty_level, next_due_at, stability, interval_days,
+                                    shuffle_key)
+            VALUES (?, ?, ?, datetime(?, 'unixepoch'), datetime(?, 'unixepoch'), ?, ?,
+                    datetime(?, 'unixepoch'), ?, ?, ?)
+        ''', card_rows())
+        flush_reviews()
+        conn.commit()
+        conn.close()
+
+        schema.migrate(path)
+
+        # The migrations stamp change counters with the wall clock
+        conn = sqlite3.connect(path)
+        with conn:
+            conn.execute("UPDATE data_versions SET updated_at = datetime(?, 'unixepoch')", (self.now,))
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Fill a new database with synthetic flashcards and reviews')
+    parser.add_argument('path', help='Database file to create')
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--cards', type=int, default=1000)
+    parser.add_argument('--reviews', type=int, help='Review events (default: 3 per card)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--now', type=int, default=DEFAULT_NOW,
+                        help='Epoch seconds the data is generated up to (default: 2026-01-01 UTC)')
+    parser.add_argument('--days', type=int, default=365, help='Cards are created over this many past days')
+    parser.add_argument('--new-fraction', type=float, default=0.2, help='Share of cards never reviewed')
+    parser.add_argument('--vocabulary', type=int, default=20000, help='Distinct words in card text')
+    parser.add_argument('--initial-stability', type=float, default=1.0,
+                        help='Days until recall drops to 1/e for a new card')
+    parser.add_argument('--stability-growth', type=float, default=2.5,
+                        help='Stability multiplier after a successful recall')
+    parser.add_argument('--lapse-factor', type=float, default=0.3,
+                        help='Stability multiplier after a failed recall')
+    parser.add_argument('--target-retention', type=float, default=0.9,
+                        help='Recall probability at which the next review is planned')
+    parser.add_argument('--max-interval', type=int, default=36500,
+                        help='Longest interval between reviews in days')
+    parser.add_argument('--force', action='store_true', help='Replace the file if it exists')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            parser.error(f'{args.path} already exists (use --force to replace it)')
+        os.remove(args.path)
+
+    curve = ForgettingCurve(args.initial_stability, args.stability_growth, args.lapse_factor,
+                            args.target_retention, args.max_interval)
+    generator = DataGenerator(args.seed, args.vocabulary, args.days, curve, args.new_fraction, args.now)
+    reviews = args.reviews if args.reviews is not None else args.cards * 3
+
+    start = time.perf_counter()
+    generator.generate(args.path, args.categories, args.cards, reviews,
+                       progress=lambda done, total: print(f'{done}/{total} cards', flush=True))
+    print(f'Generated {args.cards} cards and {reviews} reviews in {time.perf_counter() - start:.1f}s.')
+
+if __name__ == '__main__':
+    main()
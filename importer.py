@@ -0,0 +1,156 @@
+"""Streaming bulk importer for CSV and JSONL flashcard decks
+
+CSV files need a header with front and back columns (front_content and
+back_content are accepted too) and may have a category column. JSONL files
+hold one JSON object per line with the same keys. Rows are read lazily and
+inserted in chunks, one transaction per chunk, so memory stays flat and a
+10k-card deck takes a handful of transactions.
+
+Usage:
+    DATABASE_PATH=flashcards.db python importer.py deck.csv [--category "English Class"]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from models import DatabaseManager, Category, Flashcard
+
+# Column names accepted for each field, in order of preference
+FIELD_ALIASES = {
+    'front': ('front', 'front_content', 'question'),
+    'back': ('back', 'back_content', 'answer'),
+    'category': ('category', 'category_name'),
+}
+
+FORMATS = ('csv', 'jsonl')
+
+def detect_format(filename):
+    """Guess the deck format from a file name, defaulting to CSV"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return 'jsonl' if extension in ('.jsonl', '.ndjson') else 'csv'
+
+def iter_records(stream, fmt):
+    """Yield (line number, record dict or None if unparseable) from a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f'Unknown format: {fmt}')
+
+def _field(record, field):
+    for key in FIELD_ALIASES[field]:
+        value = record.get(key)
+        if value is not None:
+            return str(value).strip()
+    return ''
+
+def iter_cards(stream, fmt, default_category=None, max_field_length=10000):
+    """Yield (line number, (category name, front, back)) or (line number, error message)"""
+    for line_number, record in iter_records(stream, fmt):
+        if record is None:
+            yield line_number, 'Unreadable row'
+            continue
+        front = _field(record, 'front')
+        back = _field(record, 'back')
+        if not front or not back:
+            yield line_number, 'Both front and back content are required'
+        elif len(front) > max_field_length or len(back) > max_field_length:
+            yield line_number, f'Content longer than {max_field_length} characters'
+        else:
+            yield line_number, (_field(record, 'category') or default_category, front, back)
+
+class DeckImporter:
+    """Import flashcards from CSV/JSONL streams in chunked transactions"""
+
+    MAX_REPORTED_ERRORS = 20
+
+    def __init__(self, db_manager=None, chunk_size=1000, max_field_length=10000):
+        db_manager = db_manager or DatabaseManager()
+        self.category_model = Category(db_manager)
+        self.flashcard_model = Flashcard(db_manager)
+        self.chunk_size = chunk_size
+        self.max_field_length = max_field_length
+
+    def import_stream(self, stream, fmt='csv', default_category=None, progress=None):
+        """Import a deck from a text stream
+
+        Rows without a category go to default_category (or stay uncategorized).
+        progress, if given, is called with (imported, skipped) after each chunk.
+        """
+        category_ids = {}
+        imported = 0
+        skipped = 0
+        errors = []
+        chunk = []
+
+        def flush():
+            nonlocal imported
+            # Resolve each category name once per import, creating missing ones
+            unseen = {name for name, _, _ in chunk if name and name not in category_ids}
+            if unseen:
+                category_ids.update(self.category_model.get_or_create_categories(unseen))
+            self.flashcard_model.add_flashcards(
+                [(front, back, category_ids.get(name)) for name, front, back in chunk])
+            imported += len(chunk)
+            chunk.clear()
+            if progress:
+                progress(imported, skipped)
+
+        for line_number, row in iter_cards(stream, fmt, default_category, self.max_field_length):
+            if isinstance(row, str):
+                skipped += 1
+                if len(errors) < self.MAX_REPORTED_ERRORS:
+                    errors.append(f'Line {line_number}: {row}')
+                continue
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                flush()
+        if chunk:
+            flush()
+
+        return {'success': True, 'imported': imported, 'skipped': skipped, 'errors': errors}
+
+    def import_file(self, path, fmt=None, default_category=None, progress=None):
+        """Import a deck from a CSV or JSONL file on disk"""
+        # utf-8-sig also accepts files saved with a BOM (e.g. CSV exported by Excel)
+        with open(path, encoding='utf-8-sig', newline='') as stream:
+            return self.import_stream(stream, fmt or detect_format(path), default_category, progress)
+
+def main():
+    from schema import initialize_database
+
+    parser = argparse.ArgumentParser(description='Import flashcards from a CSV or JSONL deck')
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=FORMATS, help='Deck format (default: from file extension)')
+    parser.add_argument('--category', help='Category for rows that do not name one')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    # Uses DATABASE_PATH like the app does
+    initialize_database()
+
+    def report(imported, skipped):
+        print(f'\rImported {imported} flashcards, skipped {skipped} rows', end='', file=sys.stderr)
+
+    importer = DeckImporter(chunk_size=args.chunk_size)
+    result = importer.import_file(args.path, args.format, args.category, progress=report)
+    print(file=sys.stderr)
+    for error in result['errors']:
+        print(error, file=sys.stderr)
+    print(f"Imported {result['imported']} flashcards ({result['skipped']} rows skipped).")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""Request and SQL metrics in the Prometheus text format
+
+Every worker process keeps its own counters and histograms: route latency,
+statements run per request, statement latency and connections opened.
+They are fed by a DatabaseManager query listener and by Flask
+before/after-request hooks. After a request, at most every few seconds,
+workers write a snapshot of their metrics to a shared directory, and
+/metrics adds up the snapshots of all live workers, so the endpoint reports
+the whole gunicorn server whichever worker answers it. The snapshot of a
+worker that exited is folded into a persistent aggregate (dead.json) before
+it is removed, so counters and histograms never go down when gunicorn
+recycles workers. Separate deployments on one machine need separate
+METRICS_DIRs.
+
+Configuration (environment variables):
+    METRICS_ENABLED         0 to disable instrumentation and /metrics (default: on)
+    METRICS_DIR             directory for per-worker snapshots (default: <tmp>/flashcards-metrics)
+    METRICS_FLUSH_INTERVAL  seconds between snapshot writes of a worker (default 5)
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: collectors are not serialized between processes
+    fcntl = None
+
+from flask import Response, g, request
+
+# Histogram bucket upper bounds
+REQUEST_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REQUEST_QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+QUERY_SECONDS_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# name -> (type, help, buckets or None)
+METRICS = {
+    'flashcards_http_requests_total':
+        ('counter', 'HTTP requests by method, endpoint and status', None),
+    'flashcards_http_request_duration_seconds':
+        ('histogram', 'Time from the start of a request until its response is ready', REQUEST_SECONDS_BUCKETS),
+    'flashcards_http_request_queries':
+        ('histogram', 'SQL statements run while handling a request', REQUEST_QUERIES_BUCKETS),
+    'flashcards_db_queries_total':
+        ('counter', 'SQL statements run on pooled connections', None),
+    'flashcards_db_query_duration_seconds':
+        ('histogram', 'Time to execute a statement and fetch its rows', QUERY_SECONDS_BUCKETS),
+    'flashcards_db_connections_opened_total':
+        ('counter', 'Database connections opened by the pool', None),
+}
+
+# Values of workers that exited, kept so totals stay monotonic
+DEAD_WORKERS_FILE = 'dead.json'
+
+class Metrics:
+    """Per-process metric values, snapshotted to METRICS_DIR for aggregation"""
+
+    def __init__(self, directory, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.db_manager = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = None
+        self._last_flush = 0.0
+        self._reset()
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls):
+        """Create metrics from METRICS_* environment variables, or None if disabled"""
+        if os.environ.get('METRICS_ENABLED', '1').lower() in ('0', 'false', 'no', 'off'):
+            return None
+        directory = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'flashcards-metrics'))
+        return cls(directory, float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0)))
+
+    def _reset(self):
+        # (name, labels) -> value for counters, [bucket counts..., sum, count] for histograms
+        self._values = {}
+
+    def _check_fork(self):
+        """Start from zero in a new worker; the parent's values are in its own snapshot"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._lock = threading.Lock()
+            self._local = threading.local()
+            self._reset()
+
+    def inc(self, name, labels=(), amount=1):
+        self._check_fork()
+        with self._lock:
+            self._values[(name, labels)] = self._values.get((name, labels), 0) + amount
+
+    def observe(self, name, value, labels=()):
+        self._check_fork()
+        buckets = METRICS[name][2]
+        with self._lock:
+            entry = self._values.get((name, labels))
+            if entry is None:
+                entry = self._values[(name, labels)] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def init_app(self, app, db_manager):
+        """Instrument the app's requests and the pool's statements, and add the /metrics route"""
+        self.db_manager = db_manager
+        db_manager.add_query_listener(self.record_query)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def record_query(self, sql, parameters, seconds):
+        """Query listener: count and time a statement, and add it to the current request"""
+        self.inc('flashcards_db_queries_total')
+        self.observe('flashcards_db_query_duration_seconds', seconds)
+        if getattr(self._local, 'queries', None) is not None:
+            self._local.queries += 1
+
+    def before_request(self):
+        self._check_fork()
+        g.metrics_start = time.perf_counter()
+        self._local.queries = 0
+
+    def after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        queries, self._local.queries = getattr(self._local, 'queries', None) or 0, None
+        self.inc('flashcards_http_requests_total',
+                 (('method', request.method), ('endpoint', endpoint), ('status', str(response.status_code))))
+        self.observe('flashcards_http_request_duration_seconds', time.perf_counter() - start,
+                     (('endpoint', endpoint),))
+        self.observe('flashcards_http_request_queries', queries, (('endpoint', endpoint),))
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return response
+
+    def snapshot(self):
+        """This worker's values as a JSON-serializable list"""
+        self._check_fork()
+        with self._lock:
+            values = [[name, list(labels), value] for (name, labels), value in self._values.items()]
+        if self.db_manager is not None:
+            values.append(['flashcards_db_connections_opened_total', [], self.db_manager.connections_opened])
+        return values
+
+    def flush(self):
+        """Write this worker's snapshot to the metrics directory"""
+        self._last_flush = time.monotonic()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass
+
+    def collect(self):
+        """Sum the snapshots of every live worker and the aggregate of workers that exited"""
+        self.flush()
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            filenames = []
+        snapshots = {}
+        for filename in filenames:
+            if filename.endswith('.json') and filename[:-5].isdigit():
+                snapshots[int(filename[:-5])] = os.path.join(self.directory, filename)
+
+        dead = [path for pid, path in snapshots.items() if not pid_alive(pid)]
+        if dead:
+            self.fold_dead_workers(dead)
+
+        totals = {}
+        add_values(totals, read_values(os.path.join(self.directory, DEAD_WORKERS_FILE)))
+        for pid, path in snapshots.items():
+            if path not in dead:
+                add_values(totals, read_values(path))
+        return totals
+
+    def fold_dead_workers(self, paths):
+        """Add the snapshots at paths to the dead-worker aggregate, then remove them"""
+        aggregate_path = os.path.join(self.directory, DEAD_WORKERS_FILE)
+        try:
+            with open(os.path.join(self.directory, 'dead.lock'), 'a') as lock_file:
+                # Another worker's /metrics may be folding the same snapshots
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                totals = {}
+                add_values(totals, read_values(aggregate_path))
+                folded = []
+                for path in paths:
+                    if os.path.exists(path):
+                        add_values(totals, read_values(path))
+                        folded.append(path)
+                if not folded:
+                    return
+                with open(aggregate_path + '.tmp', 'w') as f:
+                    json.dump([[name, list(labels), value] for (name, labels), value in totals.items()], f)
+                os.replace(aggregate_path + '.tmp', aggregate_path)
+                for path in folded:
+                    os.remove(path)
+        except OSError:
+            pass
+
+    def metrics_view(self):
+        return Response(render_prometheus(self.collect()), mimetype='text/plain; version=0.0.4')
+
+def read_values(path):
+    """The [name, labels, value] entries of a snapshot file, or none if it can't be read"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def add_values(totals, values):
+    """Add snapshot entries to totals, keyed by (name, labels)"""
+    for name, labels, value in values:
+        key = (name, tuple(tuple(label) for label in labels))
+        if isinstance(value, list):
+            total = totals.setdefault(key, [0] * len(value))
+            for index, item in enumerate(value):
+                total[index] += item
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def format_labels(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus(totals):
+    """Render summed values in the Prometheus text exposition format"""
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(totals.items()):
+            if metric != name:
+                continue
+            if kind != 'histogram':
+                lines.append(f'{name}{format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {value[-1]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {value[-2]}')
+            lines.append(f'{name}_count{format_labels(labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
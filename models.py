@@ -1,255 +1,963 @@
+import os
+import re
+import base64
+import contextlib
+import random
 import sqlite3
 import datetime
+import threading
+import time
+import weakref
 from schema import DATABASE_PATH
+from scheduler import STATE_COLUMNS, format_timestamp, get_scheduler, utcnow
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement and reports it to the connection's listeners
+
+    A statement's time covers executing it and fetching its rows (SQLite does
+    most of the work of a scan while rows are fetched). It is reported once
+    all rows were fetched, when the cursor is reused or closed, or when the
+    connection goes back to the pool.
+    """
+    
+    _pending = None  # (sql, parameters, seconds so far) of a statement with unfetched rows
+    
+    def _report(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self.connection.pending_cursors.discard(self)
+            self.connection.notify(*pending)
+    
+    def _run(self, run, sql, parameters, notify_parameters):
+        self._report()
+        start = time.perf_counter()
+        try:
+            result = run(sql, parameters)
+        except BaseException:
+            self.connection.notify(sql, notify_parameters, time.perf_counter() - start)
+            raise
+        self._pending = (sql, notify_parameters, time.perf_counter() - start)
+        if self.description is None:
+            self._report()
+        else:
+            self.connection.pending_cursors.add(self)
+        return result
+    
+    def _fetched(self, start, done):
+        if self._pending is not None:
+            sql, parameters, seconds = self._pending
+            self._pending = (sql, parameters, seconds + time.perf_counter() - start)
+            if done:
+                self._report()
+    
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters, None)
+    
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is None)
+        return row
+    
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows) < size)
+        return rows
+    
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, True)
+        return rows
+    
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, True)
+            raise
+        self._fetched(start, False)
+        return row
+    
+    def close(self):
+        self._report()
+        super().close()
+    
+    def __del__(self):
+        self._report()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements all go through InstrumentedCursor"""
+    
+    listeners = ()
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_cursors = weakref.WeakSet()  # cursors with rows left to fetch
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    # sqlite3.Connection.execute doesn't go through cursor(), so route it explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def notify(self, sql, parameters, seconds):
+        """Call every listener with (sql, parameters, seconds); parameters is None for executemany"""
+        for listener in self.listeners:
+            listener(sql, parameters, seconds)
+    
+    def report_pending(self):
+        """Report the statements whose rows were not all fetched"""
+        for cursor in list(self.pending_cursors):
+            cursor._report()
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """No pooled connection became free in time"""
 
 class DatabaseManager:
-    """Class to handle database operations"""
+    """Class to handle database operations
+
+    Connections are pooled per process: ``get_connection`` hands out an idle
+    connection when one is available and ``close_connection`` returns it to the
+    pool instead of closing it, so PRAGMAs and SQLite's page cache survive
+    between requests. At most ``max_connections`` are open at once; callers
+    beyond that wait for a connection to be returned. Use ``connection()`` so
+    a connection is returned even when a query raises.
+
+    Every statement run on a pooled connection is reported to the callables
+    registered with ``add_query_listener`` (see metrics.py).
+    """
+    
+    # Connection-level PRAGMAs, applied once when a connection is opened
+    CONNECTION_PRAGMAS = (
+        ('journal_mode', os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('mmap_size', int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))),
+        ('cache_size', int(os.environ.get('SQLITE_CACHE_SIZE', -16000))),  # negative means KiB
+    )
     
-    def __init__(self, db_path=DATABASE_PATH):
+    def __init__(self, db_path=DATABASE_PATH, pool_size=None, health_check_interval=30.0,
+                 max_connections=None, timeout=None):
         self.db_path = db_path
+        self.pool_size = pool_size if pool_size is not None else int(os.environ.get('DB_POOL_SIZE', 5))
+        self.max_connections = (max_connections if max_connections is not None
+                                else int(os.environ.get('DB_MAX_CONNECTIONS', 20)))
+        self.max_connections = max(self.max_connections, self.pool_size, 1)
+        # Seconds get_connection waits for a free connection before giving up
+        self.timeout = timeout if timeout is not None else float(os.environ.get('DB_POOL_TIMEOUT', 30.0))
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Condition()
+        self._open = 0  # connections open in this process, idle or in use
+        self._idle = []  # (connection, monotonic time it was returned)
+        self._inherited = []  # connections opened by a parent process before fork
+        self._pid = os.getpid()
+        self.query_listeners = []
+        self.connections_opened = 0
     
-    def get_connection(self):
-        """Get a database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # This allows accessing columns by name
+    def add_query_listener(self, listener):
+        """Call listener(sql, parameters, seconds) after every statement on pooled connections"""
+        self.query_listeners.append(listener)
+    
+    def _check_fork(self):
+        """Drop connections inherited from a parent process (e.g. gunicorn --preload)"""
+        if self._pid != os.getpid():
+            # SQLite connections must not be used or closed across fork, so keep
+            # the parent's connections referenced and simply stop handing them out
+            self._inherited.extend(conn for conn, _ in self._idle)
+            self._idle = []
+            self._lock = threading.Condition()
+            self._open = 0
+            self._pid = os.getpid()
+            self.connections_opened = 0
+    
+    def _open_connection(self):
+        """Open a new connection and apply the connection-level PRAGMAs (its slot is already taken)"""
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=InstrumentedConnection)
+            conn.row_factory = sqlite3.Row  # This allows accessing columns by name
+            conn.listeners = self.query_listeners
+            for name, value in self.CONNECTION_PRAGMAS:
+                conn.execute(f'PRAGMA {name} = {value}')
+        except BaseException:
+            self._release_slot()
+            raise
+        with self._lock:
+            self.connections_opened += 1
         return conn
     
+    def _release_slot(self):
+        with self._lock:
+            self._open -= 1
+            self._lock.notify()
+    
+    def _is_healthy(self, conn, idle_since):
+        """Check that a pooled connection is still usable"""
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+    
+    def get_connection(self):
+        """Get a database connection, waiting up to timeout seconds if max_connections are in use"""
+        self._check_fork()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._lock:
+                while not self._idle and self._open >= self.max_connections:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f'No database connection free after {self.timeout:g}s '
+                            f'({self.max_connections} in use)')
+                    self._lock.wait(remaining)
+                if not self._idle:
+                    self._open += 1
+                    break
+                conn, idle_since = self._idle.pop()
+            if self._is_healthy(conn, idle_since):
+                return conn
+            self._discard(conn)
+        return self._open_connection()
+    
+    @contextlib.contextmanager
+    def connection(self):
+        """Context manager for a pooled connection, returned to the pool however the block exits"""
+        conn = self.get_connection()
+        try:
+            yield conn
+        finally:
+            self.close_connection(conn)
+    
     def close_connection(self, conn):
-        """Close the database connection"""
-        if conn:
+        """Return the connection to the pool, closing it if the pool is full"""
+        if not conn:
+            return
+        self._check_fork()
+        conn.report_pending()
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+                return
+        self._discard(conn)
+    
+    def close_all(self):
+        """Close every idle connection in the pool"""
+        self._check_fork()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+    
+    def _discard(self, conn):
+        """Close a connection, ignoring errors from already broken connections"""
+        try:
             conn.close()
+        except sqlite3.Error:
+            pass
+        self._release_slot()
+
+def encode_page_cursor(created_at, flashcard_id):
+    """Encode the (created_at, id) position of a flashcard as an opaque cursor"""
+    raw = f'{created_at}|{flashcard_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_page_cursor(cursor):
+    """Decode a cursor made by encode_page_cursor, raising ValueError if it is invalid"""
+    try:
+        created_at, flashcard_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return created_at, int(flashcard_id)
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid page cursor')
+
+# Markers wrapped around search matches by Flashcard.search_flashcards; they
+# are control characters so they survive HTML escaping in the templates
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+def build_search_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+def build_like_patterns(text):
+    """Turn free text into LIKE patterns, one per word, for search without FTS5"""
+    words = re.findall(r'\w+', text or '')
+    return ['%' + re.sub(r'([\\%_])', r'\\\1', word) + '%' for word in words]
+
+def has_full_text_search(cursor):
+    """Check whether the FTS5 search index exists (it is skipped when SQLite lacks FTS5)"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'flashcards_fts'")
+    return cursor.fetchone() is not None
+
+def get_data_version(cursor, name):
+    """Get the change counter of a table from data_versions (None if it is not tracked)"""
+    cursor.execute('SELECT version FROM data_versions WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_data_versions(cursor, names):
+    """Get {name: (version, updated_at)} for the tracked tables among names"""
+    placeholders = ', '.join('?' for _ in names)
+    cursor.execute(f'SELECT name, version, updated_at FROM data_versions WHERE name IN ({placeholders})',
+                   list(names))
+    return {row['name']: (row['version'], row['updated_at']) for row in cursor.fetchall()}
+
+def roll_up_due_forecast(conn, today):
+    """Fold the due_forecast days before today into today's rows (see schema.migrate_due_rollup)
+
+    The roll-up day only moves once a day and each day is folded once. If
+    another writer holds the database the roll-up is left for a later call;
+    counts are correct either way.
+    """
+    if conn.execute('SELECT day FROM due_rollup').fetchone()[0] >= today:
+        return
+    try:
+        conn.execute('''
+            INSERT INTO due_forecast (day, category_id, cards)
+            SELECT ?, category_id, SUM(cards) FROM due_forecast WHERE day < ?
+            GROUP BY category_id
+            ON CONFLICT (day, category_id) DO UPDATE SET cards = cards + excluded.cards
+        ''', (today, today))
+        conn.execute('DELETE FROM due_forecast WHERE day < ?', (today,))
+        conn.execute('UPDATE due_rollup SET day = ? WHERE day < ?', (today, today))
+        conn.commit()
+    except sqlite3.OperationalError:
+        conn.rollback()
+
+def get_due_counts(conn, today):
+    """Get {category_id: cards} of scheduled cards due by the end of today, overdue ones included"""
+    roll_up_due_forecast(conn, today)
+    cursor = conn.execute('SELECT category_id, SUM(cards) FROM due_forecast WHERE day <= ? GROUP BY category_id',
+                          (today,))
+    return dict(cursor.fetchall())
 
 class Category:
     """Model for flashcard categories"""
     
-    def __init__(self, db_manager=None):
+    def __init__(self, db_manager=None, fragment_cache=None):
         self.db_manager = db_manager or DatabaseManager()
+        # Read-through cache for get_all_categories: (data version, categories)
+        self._categories_cache = None
+        # Optional FragmentCache holding rendered category lists and cards
+        self.fragment_cache = fragment_cache
     
     def get_all_categories(self):
-        """Get all categories"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
+        """Get all categories, served from the cache while the categories version is unchanged"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Read the version before the rows: if a write lands in between, the rows
+            # are newer than the version and the next call simply reloads them
+            version = get_data_version(cursor, 'categories')
+            cached = self._categories_cache
+            
+            if cached is not None and version is not None and cached[0] == version:
+                categories = cached[1]
+            else:
+                cursor.execute('SELECT * FROM categories ORDER BY name')
+                categories = cursor.fetchall()
+                self._categories_cache = (version, categories)
         
-        cursor.execute('SELECT * FROM categories ORDER BY name')
-        categories = cursor.fetchall()
-        
-        self.db_manager.close_connection(conn)
         return categories
     
+    def get_card_counts(self):
+        """Get {category_id: {'cards', 'due', 'new'}}, with None for cards without a category
+        
+        due counts scheduled cards falling due by the end of today (UTC), and
+        new counts cards never reviewed. Both come from trigger-maintained
+        aggregates, one row per category, so this doesn't count cards and
+        doesn't grow with the review history.
+        """
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT category_id, cards, new_cards FROM category_counts')
+            counts = {row[0] or None: {'cards': row[1], 'due': 0, 'new': row[2]} for row in cursor.fetchall()}
+            
+            for category_id, due in get_due_counts(conn, utcnow().date().isoformat()).items():
+                counts.setdefault(category_id or None, {'cards': 0, 'due': 0, 'new': 0})['due'] = due
+        
+        return counts
+    
+    def invalidate_cache(self, renamed=None):
+        """Drop cached categories after a write made through this model"""
+        self._categories_cache = None
+        if self.fragment_cache is not None:
+            self.fragment_cache.invalidate('category_filter')
+            if renamed is not None:
+                # Card fragments are fingerprinted by category name first, so
+                # only the cards of the renamed category are dropped
+                self.fragment_cache.invalidate('flashcard', match=lambda fingerprint: fingerprint[0] == renamed)
+    
     def get_category_by_id(self, category_id):
         """Get a category by ID"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM categories WHERE id = ?', (category_id,))
-        category = cursor.fetchone()
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM categories WHERE id = ?', (category_id,))
+            category = cursor.fetchone()
         
-        self.db_manager.close_connection(conn)
         return category
     
     def add_category(self, name, description=''):
         """Add a new category"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                cursor.execute('INSERT INTO categories (name, description) VALUES (?, ?)', 
+                              (name, description))
+                conn.commit()
+                self.invalidate_cache()
+                result = {'success': True, 'id': cursor.lastrowid}
+            except sqlite3.IntegrityError:
+                # Category name already exists
+                result = {'success': False, 'error': 'Category name already exists'}
         
-        try:
-            cursor.execute('INSERT INTO categories (name, description) VALUES (?, ?)', 
-                          (name, description))
+        return result
+    
+    def get_or_create_categories(self, names):
+        """Get the ids of categories by name, creating missing ones in one transaction"""
+        names = list(dict.fromkeys(name for name in names if name))
+        if not names:
+            return {}
+        
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('INSERT OR IGNORE INTO categories (name, description) VALUES (?, ?)', 
+                               [(name, '') for name in names])
+            
+            category_ids = {}
+            for i in range(0, len(names), 500):
+                chunk = names[i:i + 500]
+                cursor.execute(f"SELECT id, name FROM categories WHERE name IN ({', '.join('?' * len(chunk))})", chunk)
+                category_ids.update((row['name'], row['id']) for row in cursor.fetchall())
+            
             conn.commit()
-            result = {'success': True, 'id': cursor.lastrowid}
-        except sqlite3.IntegrityError:
-            # Category name already exists
-            result = {'success': False, 'error': 'Category name already exists'}
+            self.invalidate_cache()
         
-        self.db_manager.close_connection(conn)
-        return result
+        return category_ids
     
     def update_category(self, category_id, name, description):
         """Update an existing category"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('UPDATE categories SET name = ?, description = ? WHERE id = ?', 
-                          (name, description, category_id))
-            conn.commit()
-            result = {'success': True, 'rows_affected': cursor.rowcount}
-        except sqlite3.IntegrityError:
-            # Category name already exists
-            result = {'success': False, 'error': 'Category name already exists'}
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT name FROM categories WHERE id = ?', (category_id,))
+            row = cursor.fetchone()
+            
+            try:
+                cursor.execute('UPDATE categories SET name = ?, description = ? WHERE id = ?', 
+                              (name, description, category_id))
+                conn.commit()
+                self.invalidate_cache(renamed=row['name'] if row and row['name'] != name else None)
+                result = {'success': True, 'rows_affected': cursor.rowcount}
+            except sqlite3.IntegrityError:
+                # Category name already exists
+                result = {'success': False, 'error': 'Category name already exists'}
         
-        self.db_manager.close_connection(conn)
         return result
     
     def delete_category(self, category_id):
         """Delete a category"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Check if there are flashcards in this category (counts are kept by triggers)
+            cursor.execute('SELECT cards FROM category_counts WHERE category_id = ?', (category_id,))
+            row = cursor.fetchone()
+            count = row[0] if row else 0
+            
+            if count > 0:
+                result = {'success': False, 'error': f'Cannot delete category with {count} flashcards'}
+            else:
+                cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
+                conn.commit()
+                self.invalidate_cache()
+                result = {'success': True, 'rows_affected': cursor.rowcount}
         
-        # Check if there are flashcards in this category
-        cursor.execute('SELECT COUNT(*) FROM flashcards WHERE category_id = ?', (category_id,))
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            result = {'success': False, 'error': f'Cannot delete category with {count} flashcards'}
-        else:
-            cursor.execute('DELETE FROM categories WHERE id = ?', (category_id,))
-            conn.commit()
-            result = {'success': True, 'rows_affected': cursor.rowcount}
-        
-        self.db_manager.close_connection(conn)
         return result
 
 class Flashcard:
     """Model for flashcards"""
     
-    def __init__(self, db_manager=None):
+    def __init__(self, db_manager=None, scheduler=None, fragment_cache=None):
         self.db_manager = db_manager or DatabaseManager()
+        self.scheduler = scheduler or get_scheduler()
+        # Optional FragmentCache holding rendered cards
+        self.fragment_cache = fragment_cache
     
-    def get_all_flashcards(self, category_id=None):
-        """Get all flashcards, optionally filtered by category"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        if category_id:
-            cursor.execute('''
+    def invalidate_fragment(self, flashcard_id):
+        """Drop the rendered fragment of a card after a write made through this model"""
+        if self.fragment_cache is not None:
+            self.fragment_cache.invalidate('flashcard', flashcard_id)
+    
+    def get_all_flashcards(self, category_id=None, limit=None, offset=0):
+        """Get all flashcards, optionally filtered by category and limited to a slice"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            where = 'WHERE f.category_id = ?' if category_id else ''
+            params = [category_id] if category_id else []
+            
+            # LIMIT -1 means no limit in SQLite; the ORDER BY is served by the created_at indexes
+            cursor.execute(f'''
                 SELECT f.*, c.name as category_name 
                 FROM flashcards f
                 LEFT JOIN categories c ON f.category_id = c.id
-                WHERE f.category_id = ?
-                ORDER BY f.created_at DESC
-            ''', (category_id,))
-        else:
-            cursor.execute('''
+                {where}
+                ORDER BY f.created_at DESC, f.id DESC
+                LIMIT ? OFFSET ?
+            ''', params + [limit if limit is not None else -1, offset])
+            
+            flashcards = cursor.fetchall()
+        
+        return flashcards
+    
+    def get_recent_flashcards(self, limit=10):
+        """Get the most recently created flashcards"""
+        return self.get_all_flashcards(limit=limit)
+    
+    def get_flashcards_page(self, category_id=None, after=None, limit=30):
+        """Get one page of flashcards, newest first, starting after a page cursor"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            conditions = []
+            params = []
+            if category_id:
+                conditions.append('f.category_id = ?')
+                params.append(category_id)
+            if after:
+                conditions.append('(f.created_at, f.id) < (?, ?)')
+                params.extend(decode_page_cursor(after))
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            
+            # Fetch one extra row to know whether there is a next page
+            cursor.execute(f'''
                 SELECT f.*, c.name as category_name 
                 FROM flashcards f
                 LEFT JOIN categories c ON f.category_id = c.id
-                ORDER BY f.created_at DESC
-            ''')
-        
-        flashcards = cursor.fetchall()
-        
-        self.db_manager.close_connection(conn)
-        return flashcards
+                {where}
+                ORDER BY f.created_at DESC, f.id DESC
+                LIMIT ?
+            ''', params + [limit + 1])
+            
+            flashcards = cursor.fetchall()
+        
+        
+        next_cursor = None
+        if len(flashcards) > limit:
+            flashcards = flashcards[:limit]
+            last = flashcards[-1]
+            next_cursor = encode_page_cursor(last['created_at'], last['id'])
+        return {'flashcards': flashcards, 'next_cursor': next_cursor}
+    
+    def search_flashcards(self, text, limit=20, offset=0):
+        """Full-text search over front and back content, best matches first"""
+        query = build_search_query(text)
+        if not query:
+            return {'flashcards': [], 'has_more': False}
+        
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            if has_full_text_search(cursor):
+                # bm25 weights favour matches on the front of the card
+                cursor.execute('''
+                    SELECT f.*, c.name as category_name,
+                           highlight(flashcards_fts, 0, ?, ?) AS front_highlight,
+                           highlight(flashcards_fts, 1, ?, ?) AS back_highlight
+                    FROM flashcards_fts
+                    JOIN flashcards f ON f.id = flashcards_fts.rowid
+                    LEFT JOIN categories c ON f.category_id = c.id
+                    WHERE flashcards_fts MATCH ?
+                    ORDER BY bm25(flashcards_fts, 2.0, 1.0)
+                    LIMIT ? OFFSET ?
+                ''', (HIGHLIGHT_START, HIGHLIGHT_END, HIGHLIGHT_START, HIGHLIGHT_END, query, limit + 1, offset))
+            else:
+                # SQLite without FTS5: every word must appear on either side,
+                # newest cards first and without highlighting
+                patterns = build_like_patterns(text)
+                conditions = ' AND '.join(
+                    "(f.front_content LIKE ? ESCAPE '\\' OR f.back_content LIKE ? ESCAPE '\\')" for _ in patterns)
+                parameters = [pattern for pattern in patterns for _ in range(2)]
+                cursor.execute(f'''
+                    SELECT f.*, c.name as category_name,
+                           f.front_content AS front_highlight,
+                           f.back_content AS back_highlight
+                    FROM flashcards f
+                    LEFT JOIN categories c ON f.category_id = c.id
+                    WHERE {conditions}
+                    ORDER BY f.created_at DESC, f.id DESC
+                    LIMIT ? OFFSET ?
+                ''', parameters + [limit + 1, offset])
+            
+            flashcards = cursor.fetchall()
+        
+        return {'flashcards': flashcards[:limit], 'has_more': len(flashcards) > limit}
     
     def get_flashcard_by_id(self, flashcard_id):
         """Get a flashcard by ID"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT f.*, c.name as category_name 
-            FROM flashcards f
-            LEFT JOIN categories c ON f.category_id = c.id
-            WHERE f.id = ?
-        ''', (flashcard_id,))
-        
-        flashcard = cursor.fetchone()
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT f.*, c.name as category_name 
+                FROM flashcards f
+                LEFT JOIN categories c ON f.category_id = c.id
+                WHERE f.id = ?
+            ''', (flashcard_id,))
+            
+            flashcard = cursor.fetchone()
         
-        self.db_manager.close_connection(conn)
         return flashcard
     
     def add_flashcard(self, front_content, back_content, category_id=None):
         """Add a new flashcard"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO flashcards (category_id, front_content, back_content) 
-            VALUES (?, ?, ?)
-        ''', (category_id, front_content, back_content))
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO flashcards (category_id, front_content, back_content) 
+                VALUES (?, ?, ?)
+            ''', (category_id, front_content, back_content))
+            
+            conn.commit()
+            result = {'success': True, 'id': cursor.lastrowid}
         
-        conn.commit()
-        result = {'success': True, 'id': cursor.lastrowid}
+        return result
+    
+    def add_flashcards(self, flashcards):
+        """Add many flashcards in one transaction from (front, back, category_id) tuples"""
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
+                INSERT INTO flashcards (front_content, back_content, category_id) 
+                VALUES (?, ?, ?)
+            ''', flashcards)
+            
+            conn.commit()
+            result = {'success': True, 'count': cursor.rowcount}
         
-        self.db_manager.close_connection(conn)
         return result
     
     def update_flashcard(self, flashcard_id, front_content, back_content, category_id=None):
         """Update an existing flashcard"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE flashcards 
-            SET front_content = ?, back_content = ?, category_id = ? 
-            WHERE id = ?
-        ''', (front_content, back_content, category_id, flashcard_id))
-        
-        conn.commit()
-        result = {'success': True, 'rows_affected': cursor.rowcount}
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE flashcards 
+                SET front_content = ?, back_content = ?, category_id = ? 
+                WHERE id = ?
+            ''', (front_content, back_content, category_id, flashcard_id))
+            
+            conn.commit()
+            result = {'success': True, 'rows_affected': cursor.rowcount}
         
-        self.db_manager.close_connection(conn)
+        self.invalidate_fragment(flashcard_id)
         return result
     
     def delete_flashcard(self, flashcard_id):
         """Delete a flashcard"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # First delete any review history
-        cursor.execute('DELETE FROM review_history WHERE flashcard_id = ?', (flashcard_id,))
-        
-        # Then delete the flashcard
-        cursor.execute('DELETE FROM flashcards WHERE id = ?', (flashcard_id,))
-        
-        conn.commit()
-        result = {'success': True, 'rows_affected': cursor.rowcount}
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            # First delete any review history
+            cursor.execute('DELETE FROM review_history WHERE flashcard_id = ?', (flashcard_id,))
+            
+            # Then delete the flashcard
+            cursor.execute('DELETE FROM flashcards WHERE id = ?', (flashcard_id,))
+            
+            conn.commit()
+            result = {'success': True, 'rows_affected': cursor.rowcount}
         
-        self.db_manager.close_connection(conn)
+        self.invalidate_fragment(flashcard_id)
         return result
     
-    def get_cards_for_review(self, limit=20):
-        """Get flashcards that are due for review based on spaced repetition"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Get cards that haven't been reviewed or are due for review
-        # This is a simple implementation - a more sophisticated algorithm could be used
-        cursor.execute('''
-            SELECT f.*, c.name as category_name 
-            FROM flashcards f
-            LEFT JOIN categories c ON f.category_id = c.id
-            WHERE f.last_reviewed IS NULL
-            OR datetime(f.last_reviewed, '+' || (f.difficulty_level + 1) || ' days') <= datetime('now')
-            ORDER BY RANDOM()
-            LIMIT ?
-        ''', (limit,))
-        
-        cards = cursor.fetchall()
-        
-        self.db_manager.close_connection(conn)
+    # Due backlogs smaller than limit * REVIEW_SAMPLE_FACTOR are sampled exactly
+    REVIEW_SAMPLE_FACTOR = 50
+    
+    # Cards that have never been reviewed or whose next review date has passed
+    DUE_CLAUSE = "(next_due_at IS NULL OR next_due_at <= datetime('now'))"
+    
+    def get_cards_for_review(self, limit=20, exclude_ids=None):
+        """Get a random sample of flashcards that are due for review
+        
+        Cards in exclude_ids (e.g. ones a client is still showing or hasn't
+        submitted ratings for yet) are never returned.
+        """
+        exclude = set(exclude_ids or ())
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Read due ids from idx_flashcards_next_due_at, but never more than a
+            # fixed multiple of the limit, so this costs O(limit) however big the backlog
+            cap = (limit + len(exclude)) * self.REVIEW_SAMPLE_FACTOR
+            cursor.execute(f'SELECT id FROM flashcards WHERE {self.DUE_CLAUSE} LIMIT ?', (cap,))
+            due_ids = [row[0] for row in cursor.fetchall()]
+            
+            if len(due_ids) < cap:
+                # The whole due set fits under the cap: sample it uniformly
+                due_ids = [card_id for card_id in due_ids if card_id not in exclude]
+                card_ids = random.sample(due_ids, min(limit, len(due_ids)))
+            else:
+                # Large backlog: walk the (shuffle_key, next_due_at) index from a
+                # random pivot, wrapping around to the start, and keep the first
+                # due cards found (the due check is read from the index)
+                # (over-fetching by the excluded count so exclusions can't starve the batch)
+                pivot = random.randint(-2 ** 63, 2 ** 63 - 1)
+                cursor.execute(f'''
+                    SELECT id FROM flashcards INDEXED BY idx_flashcards_shuffle_key
+                    WHERE shuffle_key >= ? AND {self.DUE_CLAUSE}
+                    ORDER BY shuffle_key
+                    LIMIT ?
+                ''', (pivot, limit + len(exclude)))
+                card_ids = [row[0] for row in cursor.fetchall() if row[0] not in exclude][:limit]
+                
+                if len(card_ids) < limit:
+                    cursor.execute(f'''
+                        SELECT id FROM flashcards INDEXED BY idx_flashcards_shuffle_key
+                        WHERE shuffle_key < ? AND {self.DUE_CLAUSE}
+                        ORDER BY shuffle_key
+                        LIMIT ?
+                    ''', (pivot, limit - len(card_ids) + len(exclude)))
+                    card_ids.extend(row[0] for row in cursor.fetchall() if row[0] not in exclude)
+                    card_ids = card_ids[:limit]
+            
+            cards = []
+            if card_ids:
+                placeholders = ', '.join('?' * len(card_ids))
+                cursor.execute(f'''
+                    SELECT f.*, c.name as category_name 
+                    FROM flashcards f
+                    LEFT JOIN categories c ON f.category_id = c.id
+                    WHERE f.id IN ({placeholders})
+                ''', card_ids)
+                cards = cursor.fetchall()
+                random.shuffle(cards)
+        
         return cards
     
     def record_review(self, flashcard_id, performance_rating):
-        """Record a review of a flashcard"""
-        conn = self.db_manager.get_connection()
-        cursor = conn.cursor()
-        
-        # Ensure performance rating is between 1 and 5
-        performance_rating = max(1, min(5, performance_rating))
-        
-        # Update the review count and last reviewed timestamp
-        cursor.execute('''
-            UPDATE flashcards 
-            SET review_count = review_count + 1,
-                last_reviewed = datetime('now'),
-                difficulty_level = CASE
-                    WHEN ? >= 4 THEN difficulty_level + 1  -- Increase difficulty if well remembered
-                    WHEN ? <= 2 THEN max(0, difficulty_level - 1)  -- Decrease difficulty if poorly remembered
-                    ELSE difficulty_level  -- Keep the same if medium performance
-                END
-            WHERE id = ?
-        ''', (performance_rating, performance_rating, flashcard_id))
-        
-        # Add to review history
-        cursor.execute('''
-            INSERT INTO review_history (flashcard_id, performance_rating)
-            VALUES (?, ?)
-        ''', (flashcard_id, performance_rating))
-        
-        conn.commit()
-        result = {'success': True}
+        """Record a review of a flashcard and reschedule it"""
+        result = self.record_reviews([{'flashcard_id': flashcard_id, 'rating': performance_rating}])
+        if result['skipped']:
+            return {'success': False, 'error': 'Flashcard not found'}
+        return {'success': True}
+    
+    # Maximum number of ids bound in one IN (...) lookup
+    STATE_LOOKUP_CHUNK = 500
+    
+    def record_reviews(self, reviews):
+        """Record a batch of reviews in one transaction
+        
+        Each review is a dict with flashcard_id, rating and an optional
+        reviewed_at datetime (UTC); reviews of the same card are applied in
+        reviewed_at order. Reviews of unknown flashcards are skipped.
+        """
+        now = utcnow()
+        reviews = sorted(
+            ({'flashcard_id': review['flashcard_id'],
+              # Ensure performance rating is between 1 and 5
+              'rating': max(1, min(5, review['rating'])),
+              'reviewed_at': min(review.get('reviewed_at') or now, now)}
+             for review in reviews),
+            key=lambda review: review['reviewed_at'])
+        
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Load the scheduler state of every card in the batch up front
+            card_ids = list({review['flashcard_id'] for review in reviews})
+            cards = {}
+            for i in range(0, len(card_ids), self.STATE_LOOKUP_CHUNK):
+                chunk = card_ids[i:i + self.STATE_LOOKUP_CHUNK]
+                cursor.execute(f'''
+                    SELECT id, last_reviewed, {', '.join(STATE_COLUMNS)}
+                    FROM flashcards WHERE id IN ({', '.join('?' * len(chunk))})
+                ''', chunk)
+                cards.update((row['id'], dict(row)) for row in cursor.fetchall())
+            
+            history = []
+            review_counts = {}
+            skipped = []
+            for review in reviews:
+                card = cards.get(review['flashcard_id'])
+                if card is None:
+                    skipped.append(review['flashcard_id'])
+                    continue
+                reviewed_at = format_timestamp(review['reviewed_at'])
+                card.update(self.scheduler.schedule(card, review['rating'], review['reviewed_at']))
+                card['last_reviewed'] = reviewed_at
+                review_counts[card['id']] = review_counts.get(card['id'], 0) + 1
+                history.append((card['id'], review['rating'], reviewed_at))
+            
+            # One UPDATE per card with its final state; the shuffle key is re-drawn
+            # so neighbours in the review sample keep changing
+            cursor.executemany('''
+                UPDATE flashcards 
+                SET review_count = review_count + ?,
+                    last_reviewed = ?,
+                    difficulty_level = ?,
+                    ease = ?,
+                    stability = ?,
+                    difficulty = ?,
+                    interval_days = ?,
+                    next_due_at = ?,
+                    shuffle_key = random()
+                WHERE id = ?
+            ''', [(count, cards[card_id]['last_reviewed'], cards[card_id]['difficulty_level'],
+                   cards[card_id]['ease'], cards[card_id]['stability'], cards[card_id]['difficulty'],
+                   cards[card_id]['interval_days'], cards[card_id]['next_due_at'], card_id)
+                  for card_id, count in review_counts.items()])
+            
+            # Add to review history
+            cursor.executemany('''
+                INSERT INTO review_history (flashcard_id, performance_rating, reviewed_at)
+                VALUES (?, ?, ?)
+            ''', history)
+            
+            conn.commit()
+            result = {'success': True, 'recorded': len(history), 'skipped': skipped}
         
-        self.db_manager.close_connection(conn)
-        return result
\ No newline at end of file
+        return result
+    
+    def reschedule_all(self):
+        """Recompute every reviewed card's due date with the current scheduler parameters"""
+        with self.db_manager.connection() as conn:
+            count = self.scheduler.reschedule_all(conn)
+        return {'success': True, 'rows_affected': count}
+
+def summarize_reviews(reviews, rating_sum, recalled):
+    """Review count with average rating and retention (share of reviews rated 3 or higher)"""
+    return {'reviews': reviews,
+            'average_rating': round(rating_sum / reviews, 2) if reviews else None,
+            'retention': round(recalled / reviews, 3) if reviews else None}
+
+def count_streaks(study_days, today):
+    """(current, longest) runs of consecutive days in sorted study_days; today may still be unstudied"""
+    longest = run = 0
+    previous = None
+    for day in study_days:
+        run = run + 1 if previous is not None and (day - previous).days == 1 else 1
+        longest = max(longest, run)
+        previous = day
+    current = run if previous is not None and (today - previous).days <= 1 else 0
+    return current, longest
+
+class StudyStats:
+    """Study statistics, read from the daily_stats, due_forecast and category_counts aggregate tables"""
+    
+    def __init__(self, db_manager=None):
+        self.db_manager = db_manager or DatabaseManager()
+    
+    def get_stats(self, days=30, forecast_days=7):
+        """Reviews, retention, streaks and due cards, per day and per category
+        
+        Days are UTC dates. Nothing here reads review_history or flashcards,
+        so the cost doesn't grow with the number of reviews or cards.
+        """
+        today = utcnow().date()
+        first_day = today - datetime.timedelta(days=days - 1)
+        last_forecast_day = today + datetime.timedelta(days=forecast_days)
+        with self.db_manager.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT day, SUM(reviews), SUM(rating_sum), SUM(recalled)
+                FROM daily_stats WHERE day >= ?
+                GROUP BY day
+            ''', (first_day.isoformat(),))
+            by_day = {row[0]: row[1:] for row in cursor.fetchall()}
+            
+            cursor.execute('''
+                SELECT category_id, SUM(reviews), SUM(rating_sum), SUM(recalled)
+                FROM daily_stats WHERE day >= ?
+                GROUP BY category_id
+            ''', (first_day.isoformat(),))
+            reviews_by_category = {row[0]: row[1:] for row in cursor.fetchall()}
+            
+            # Every day anything was studied, to find streaks
+            cursor.execute('SELECT DISTINCT day FROM daily_stats ORDER BY day')
+            study_days = [datetime.date.fromisoformat(row[0]) for row in cursor.fetchall()]
+            
+            # Scheduled cards falling due by the end of today, overdue ones
+            # included, from the same rolled-up rows as the category counts
+            due_by_category = get_due_counts(conn, today.isoformat())
+            
+            cursor.execute('''
+                SELECT day, SUM(cards) FROM due_forecast WHERE day > ? AND day <= ?
+                GROUP BY day
+            ''', (today.isoformat(), last_forecast_day.isoformat()))
+            forecast_by_day = dict(cursor.fetchall())
+            
+            # Cards never reviewed, which are due as well
+            cursor.execute('SELECT category_id, new_cards FROM category_counts WHERE new_cards > 0')
+            new_by_category = dict(cursor.fetchall())
+            
+            cursor.execute('SELECT id, name FROM categories')
+            names = dict(cursor.fetchall())
+        
+        
+        daily = []
+        for offset in range(days):
+            day = (first_day + datetime.timedelta(days=offset)).isoformat()
+            daily.append({'day': day, **summarize_reviews(*by_day.get(day, (0, 0, 0)))})
+        
+        forecast = []
+        for offset in range(1, forecast_days + 1):
+            day = (today + datetime.timedelta(days=offset)).isoformat()
+            forecast.append({'day': day, 'cards': forecast_by_day.get(day, 0)})
+        
+        period = [sum(totals[i] for totals in by_day.values()) for i in range(3)]
+        current_streak, longest_streak = count_streaks(study_days, today)
+        
+        # Category 0 holds cards without a category; reviews of since deleted
+        # categories count in the totals only
+        categories = []
+        for category_id in set(reviews_by_category) | set(due_by_category) | set(new_by_category):
+            if category_id not in names and category_id != 0:
+                continue
+            categories.append({'id': category_id or None,
+                               'name': names.get(category_id, 'Uncategorized'),
+                               'due': due_by_category.get(category_id, 0),
+                               'new': new_by_category.get(category_id, 0),
+                               **summarize_reviews(*reviews_by_category.get(category_id, (0, 0, 0)))})
+        categories.sort(key=lambda category: (category['id'] is None, category['name'].lower()))
+        
+        return {'today': daily[-1],
+                'period': {'days': days, **summarize_reviews(*period)},
+                'streak': {'current': current_streak, 'longest': longest_streak},
+                'due': {'today': sum(due_by_category.values()), 'new': sum(new_by_category.values()),
+                        'forecast': forecast},
+                'daily': daily,
+                'categories': categories}
@@ -0,0 +1,288 @@
+"""Query-plan checks for every Category, Flashcard and StudyStats statement
+
+Builds a populated database with generate_data.py, calls every Category,
+Flashcard and StudyStats method against it while recording the statements they run,
+and checks the EXPLAIN QUERY PLAN of each statement against EXPECTATIONS:
+
+- the plan uses the index listed for the statement;
+- there is no full scan of flashcards or review_history (a SCAN without an
+  index) and no USE TEMP B-TREE FOR ORDER BY, unless the statement is
+  listed as accepting one.
+
+A statement without an expectation fails too, as does an expectation no
+statement matched, so new or changed queries have to be registered here.
+Exits with status 1 if any check fails, so it can run in CI:
+
+    python query_plan_check.py [--cards 5000] [--database PATH] [--verbose]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+PRIMARY_KEY = 'INTEGER PRIMARY KEY'
+
+# Plan problems a statement may be listed as accepting
+SCAN = 'scan'
+TEMP_ORDER = 'temp_order'
+
+# Tables too big to scan on a request path
+LARGE_TABLES = ('flashcards', 'review_history')
+
+# (method, regex searched in the statement, text the plan must contain or None, accepted problems)
+EXPECTATIONS = (
+    ('Category.get_all_categories', r'FROM data_versions WHERE name = \?', 'sqlite_autoindex_data_versions_1', ()),
+    ('Category.get_all_categories', r'FROM categories ORDER BY name', 'sqlite_autoindex_categories_1', ()),
+    ('Category.get_category_by_id', r'FROM categories WHERE id = \?', PRIMARY_KEY, ()),
+    ('Category.add_category', r'^INSERT INTO categories', None, ()),
+    ('Category.get_or_create_categories', r'^INSERT OR IGNORE INTO categories', None, ()),
+    ('Category.get_or_create_categories', r'FROM categories WHERE name IN', 'sqlite_autoindex_categories_1', ()),
+    ('Category.update_category', r'FROM categories WHERE id = \?', PRIMARY_KEY, ()),
+    ('Category.update_category', r'^UPDATE categories', PRIMARY_KEY, ()),
+    # Card counts are kept per category by triggers, so nothing counts cards
+    ('Category.get_card_counts', r'FROM category_counts$', None, ()),
+    ('Category.get_card_counts', r'SELECT day FROM due_rollup', None, ()),
+    ('Category.get_card_counts', r'^INSERT INTO due_forecast .* WHERE day < \?', 'USING PRIMARY KEY (day<?)', ()),
+    ('Category.get_card_counts', r'^DELETE FROM due_forecast WHERE day < \?', 'USING PRIMARY KEY (day<?)', ()),
+    ('Category.get_card_counts', r'^UPDATE due_rollup', None, ()),
+    ('Category.get_card_counts', r'FROM due_forecast WHERE day <= \?', 'USING PRIMARY KEY (day<?)', ()),
+    ('Category.delete_category', r'FROM category_counts WHERE category_id = \?', PRIMARY_KEY, ()),
+    ('Category.delete_category', r'^DELETE FROM categories WHERE id = \?', PRIMARY_KEY, ()),
+
+    # Newest first, read in created_at order from the index (the unlimited
+    # call walks all of it, but never sorts)
+    ('Flashcard.get_all_flashcards', r'WHERE f\.category_id = \? ORDER BY f\.created_at DESC',
+     'idx_flashcards_category_created_at', ()),
+    ('Flashcard.get_all_flashcards', r'ON f\.category_id = c\.id ORDER BY f\.created_at DESC',
+     'idx_flashcards_created_at', ()),
+    ('Flashcard.get_flashcards_page', r'WHERE f\.category_id = \?', 'idx_flashcards_category_created_at', ()),
+    ('Flashcard.get_flashcards_page', r'WHERE \(f\.created_at, f\.id\) < \(\?, \?\)',
+     'idx_flashcards_created_at (created_at<?)', ()),
+    ('Flashcard.get_flashcards_page', r'ON f\.category_id = c\.id ORDER BY f\.created_at DESC',
+     'idx_flashcards_created_at', ()),
+    # Results are ranked by bm25, which no index can provide
+    # The schema table is a handful of rows; the LIKE fallback only runs without FTS5
+    ('Flashcard.search_flashcards', r"FROM sqlite_master WHERE type = 'table'", 'SCAN sqlite_master', ()),
+    ('Flashcard.search_flashcards', r'WHERE flashcards_fts MATCH \?', 'flashcards_fts VIRTUAL TABLE', (TEMP_ORDER,)),
+    ('Flashcard.get_flashcard_by_id', r'WHERE f\.id = \?', PRIMARY_KEY, ()),
+    ('Flashcard.add_flashcard', r'^INSERT INTO flashcards', None, ()),
+    ('Flashcard.add_flashcards', r'^INSERT INTO flashcards', None, ()),
+    ('Flashcard.update_flashcard', r'^UPDATE flashcards SET front_content', PRIMARY_KEY, ()),
+    ('Flashcard.delete_flashcard', r'^DELETE FROM review_history WHERE flashcard_id = \?',
+     'idx_review_history_flashcard_id', ()),
+    ('Flashcard.delete_flashcard', r'^DELETE FROM flashcards WHERE id = \?', PRIMARY_KEY, ()),
+    ('Flashcard.get_cards_for_review', r'^SELECT id FROM flashcards WHERE \(next_due_at',
+     'idx_flashcards_next_due_at', ()),
+    # The due check is answered from the index, without a row lookup per entry
+    ('Flashcard.get_cards_for_review', r'INDEXED BY idx_flashcards_shuffle_key',
+     'USING COVERING INDEX idx_flashcards_shuffle_key', ()),
+    ('Flashcard.get_cards_for_review', r'WHERE f\.id IN \(', PRIMARY_KEY, ()),
+    ('Flashcard.record_reviews', r'FROM flashcards WHERE id IN \(', PRIMARY_KEY, ()),
+    ('Flashcard.record_reviews', r'^UPDATE flashcards SET review_count', PRIMARY_KEY, ()),
+    ('Flashcard.record_reviews', r'^INSERT INTO review_history', None, ()),
+    # Rescheduling rewrites every reviewed card, so it scans by design
+    ('Flashcard.reschedule_all', r'^UPDATE flashcards SET next_due_at', None, (SCAN,)),
+
+    # Statistics only read the aggregate tables, which grow by a row per day
+    # and category, never with the number of reviews or cards
+    ('StudyStats.get_stats', r'FROM daily_stats WHERE day >= \? GROUP BY day', 'USING PRIMARY KEY (day>?)', ()),
+    ('StudyStats.get_stats', r'FROM daily_stats WHERE day >= \? GROUP BY category_id',
+     'USING PRIMARY KEY (day>?)', ()),
+    ('StudyStats.get_stats', r'SELECT DISTINCT day FROM daily_stats', 'SCAN daily_stats', ()),
+    ('StudyStats.get_stats', r'SELECT day FROM due_rollup', None, ()),
+    ('StudyStats.get_stats', r'^INSERT INTO due_forecast .* WHERE day < \?', 'USING PRIMARY KEY (day<?)', ()),
+    ('StudyStats.get_stats', r'^DELETE FROM due_forecast WHERE day < \?', 'USING PRIMARY KEY (day<?)', ()),
+    ('StudyStats.get_stats', r'^UPDATE due_rollup', None, ()),
+    ('StudyStats.get_stats', r'FROM due_forecast WHERE day <= \?', 'USING PRIMARY KEY (day<?)', ()),
+    ('StudyStats.get_stats', r'FROM due_forecast WHERE day > \? AND day <= \?',
+     'USING PRIMARY KEY (day>? AND day<?)', ()),
+    ('StudyStats.get_stats', r'FROM category_counts WHERE new_cards > 0', None, ()),
+    ('StudyStats.get_stats', r'^SELECT id, name FROM categories', None, ()),
+)
+
+# Statements that have no query plan worth checking
+UNPLANNED = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+def exercise(categories, flashcards, stats):
+    """Call every model method, yielding the method name before each call"""
+    from models import encode_page_cursor
+
+    category_id = categories.get_all_categories()[0]['id']
+    empty_category_id = categories.add_category('plan-check-empty', '')['id']
+    card_ids = [card['id'] for card in flashcards.get_all_flashcards(category_id)]
+    newest = flashcards.get_all_flashcards(limit=1)[0]
+    cursor = encode_page_cursor(newest['created_at'], newest['id'])
+    categories.invalidate_cache()
+
+    def roll_up_from_scratch():
+        # An empty roll-up day makes the next due count fold every overdue day
+        conn = sqlite3.connect(categories.db_manager.db_path)
+        with conn:
+            conn.execute("UPDATE due_rollup SET day = ''")
+        conn.close()
+
+    def sample_backlog():
+        # A factor of 0 makes any backlog count as large, so the shuffle index
+        # is used even on a database with only a few due cards
+        flashcards.REVIEW_SAMPLE_FACTOR = 0
+        try:
+            return flashcards.get_cards_for_review(20)
+        finally:
+            del flashcards.REVIEW_SAMPLE_FACTOR
+
+    calls = (
+        ('Category.get_all_categories', lambda: categories.get_all_categories()),
+        ('Category.get_category_by_id', lambda: categories.get_category_by_id(category_id)),
+        ('Category.get_card_counts', lambda: roll_up_from_scratch() or categories.get_card_counts()),
+        ('Category.add_category', lambda: categories.add_category('plan-check', '')),
+        ('Category.get_or_create_categories', lambda: categories.get_or_create_categories(['plan-check', 'new'])),
+        ('Category.update_category', lambda: categories.update_category(empty_category_id, 'plan-check-2', '')),
+        ('Category.delete_category', lambda: categories.delete_category(category_id)),
+        ('Category.delete_category', lambda: categories.delete_category(empty_category_id)),
+        ('Flashcard.get_all_flashcards', lambda: flashcards.get_all_flashcards()),
+        ('Flashcard.get_all_flashcards', lambda: flashcards.get_all_flashcards(category_id)),
+        ('Flashcard.get_all_flashcards', lambda: flashcards.get_all_flashcards(limit=30)),
+        ('Flashcard.get_flashcards_page', lambda: flashcards.get_flashcards_page()),
+        ('Flashcard.get_flashcards_page', lambda: flashcards.get_flashcards_page(category_id)),
+        ('Flashcard.get_flashcards_page', lambda: flashcards.get_flashcards_page(after=cursor)),
+        ('Flashcard.get_flashcards_page', lambda: flashcards.get_flashcards_page(category_id, after=cursor)),
+        ('Flashcard.search_flashcards', lambda: flashcards.search_flashcards(newest['front_content'])),
+        ('Flashcard.get_flashcard_by_id', lambda: flashcards.get_flashcard_by_id(card_ids[0])),
+        ('Flashcard.add_flashcard', lambda: flashcards.add_flashcard('front', 'back', category_id)),
+        ('Flashcard.add_flashcards', lambda: flashcards.add_flashcards([('front', 'back', category_id)] * 3)),
+        ('Flashcard.update_flashcard', lambda: flashcards.update_flashcard(card_ids[1], 'front', 'back', category_id)),
+        ('Flashcard.delete_flashcard', lambda: flashcards.delete_flashcard(card_ids[2])),
+        # Small limits sample a large backlog through the shuffle index; a
+        # limit whose cap exceeds the backlog reads the whole due set
+        ('Flashcard.get_cards_for_review', sample_backlog),
+        ('Flashcard.get_cards_for_review', lambda: flashcards.get_cards_for_review(20)),
+        ('Flashcard.get_cards_for_review', lambda: flashcards.get_cards_for_review(20, card_ids[:50])),
+        ('Flashcard.get_cards_for_review', lambda: flashcards.get_cards_for_review(10 ** 6)),
+        ('Flashcard.record_reviews', lambda: flashcards.record_review(card_ids[3], 4)),
+        ('Flashcard.record_reviews',
+         lambda: flashcards.record_reviews([{'flashcard_id': card_id, 'rating': 3} for card_id in card_ids[4:24]])),
+        ('Flashcard.reschedule_all', lambda: flashcards.reschedule_all()),
+        ('StudyStats.get_stats', lambda: roll_up_from_scratch() or stats.get_stats()),
+    )
+    for method, call in calls:
+        yield method
+        call()
+
+def scanned_aliases(sql):
+    """Names a large table goes by in a statement (the table name and any alias)"""
+    names = set(LARGE_TABLES)
+    for table in LARGE_TABLES:
+        for alias in re.findall(rf'\b{table}\s+(?:AS\s+)?(\w+)', sql, re.IGNORECASE):
+            if alias.upper() not in ('WHERE', 'SET', 'INDEXED', 'LEFT', 'JOIN', 'ON', 'ORDER', 'LIMIT',
+                                     'GROUP', 'VALUES', 'USING'):
+                names.add(alias)
+    return names
+
+def check_plan(sql, plan, uses, accepted):
+    """Problems with one statement's plan, as a list of messages"""
+    problems = []
+    text = '\n'.join(plan)
+    if uses and uses not in text:
+        problems.append(f'expected the plan to use {uses}')
+    if SCAN not in accepted:
+        for name in scanned_aliases(sql):
+            for line in plan:
+                if re.fullmatch(rf'SCAN {re.escape(name)}', line.strip()):
+                    problems.append(f'full scan: {line.strip()}')
+    if TEMP_ORDER not in accepted and 'USE TEMP B-TREE FOR ORDER BY' in text:
+        problems.append('sorts in a temporary b-tree instead of reading an index in order')
+    return problems
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN detail lines, with NULLs bound for executemany statements"""
+    if parameters is None:
+        parameters = [None] * sql.count('?')
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)]
+
+def run_checks(path, verbose=False):
+    """Exercise the models on the database at path; return the number of failures"""
+    from models import Category, DatabaseManager, Flashcard, StudyStats
+
+    db_manager = DatabaseManager(path)
+    categories = Category(db_manager)
+    flashcards = Flashcard(db_manager)
+    stats = StudyStats(db_manager)
+
+    explain_conn = sqlite3.connect(path)
+    # Functions the models register on their own connections before using them
+    explain_conn.create_function('scheduled_interval', 5, lambda *args: None)
+
+    current = [None]
+    statements = {}  # (method, sql) -> parameters of the first call
+
+    def record(sql, parameters, seconds):
+        sql = ' '.join(sql.split())
+        if current[0] and not sql.upper().startswith(UNPLANNED):
+            statements.setdefault((current[0], sql), parameters)
+
+    db_manager.add_query_listener(record)
+    for method in exercise(categories, flashcards, stats):
+        current[0] = method
+    current[0] = None
+    db_manager.close_all()
+
+    failures = 0
+    matched = set()
+    for (method, sql), parameters in statements.items():
+        expectations = [expectation for expectation in EXPECTATIONS
+                        if expectation[0] == method and re.search(expectation[1], sql)]
+        plan = explain(explain_conn, sql, parameters)
+        if not expectations:
+            problems = ['no expectation registered for this statement']
+        else:
+            matched.add(expectations[0])
+            problems = check_plan(sql, plan, expectations[0][2], expectations[0][3])
+        if problems:
+            failures += 1
+        if problems or verbose:
+            print(f"{'FAIL' if problems else 'ok  '} {method}: {sql[:120]}")
+            for line in plan:
+                print(f'       {line}')
+            for problem in problems:
+                print(f'     - {problem}')
+
+    for expectation in EXPECTATIONS:
+        if expectation not in matched:
+            failures += 1
+            print(f'FAIL {expectation[0]}: no statement matched {expectation[1]!r}')
+
+    explain_conn.close()
+    return failures
+
+def build_database(path, database=None, cards=5000, seed=0):
+    """Create the database to check at path: a migrated copy of database, or generated data"""
+    if database:
+        shutil.copyfile(database, path)
+        import schema
+        schema.migrate(path)
+    else:
+        from generate_data import DataGenerator
+        DataGenerator(seed=seed).generate(path, cards=cards, reviews=cards * 3)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the query plans of every model statement')
+    parser.add_argument('--cards', type=int, default=5000, help='Cards in the generated database')
+    parser.add_argument('--database', help='Check against a copy of this database instead')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help='Print every plan, not just failures')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'plans.db')
+        build_database(path, args.database, args.cards, args.seed)
+        failures = run_checks(path, args.verbose)
+
+    print(f"{len(EXPECTATIONS)} expectations, {failures} failure{'' if failures == 1 else 's'}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Write-behind buffer for review ratings
+
+When enabled, ratings are queued in memory and a background thread commits
+them in groups through Flashcard.record_reviews, so concurrent reviewers
+share one write transaction (and one fsync) per group instead of one each.
+Ratings accepted but not yet flushed are lost if the process is killed, so
+the flush interval bounds how much can be lost; queued ratings are flushed
+on normal shutdown.
+
+Configuration (environment variables):
+    REVIEW_WRITE_BEHIND     1 to enable (default: off, reviews commit immediately)
+    REVIEW_FLUSH_INTERVAL   seconds a rating may wait before it is committed (default 1.0)
+    REVIEW_FLUSH_BATCH      ratings per group commit (default 200)
+    REVIEW_QUEUE_SIZE       ratings held in memory before overflow (default 10000)
+    REVIEW_QUEUE_OVERFLOW   'sync' to write directly or 'block' to wait when full (default sync)
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from scheduler import utcnow
+
+logger = logging.getLogger(__name__)
+
+# Control messages passed through the queue alongside reviews
+_FLUSH = object()
+_STOP = object()
+
+class ReviewWriteBuffer:
+    """Bounded in-process queue of reviews committed in groups by a flusher thread"""
+
+    WRITE_ATTEMPTS = 3
+
+    def __init__(self, flashcard_model, flush_interval=1.0, max_batch=200, max_queue=10000,
+                 overflow='sync'):
+        if overflow not in ('sync', 'block'):
+            raise ValueError(f'Unknown overflow policy: {overflow}')
+        self.flashcard_model = flashcard_model
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.overflow = overflow
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls, flashcard_model):
+        """Create a buffer from REVIEW_* environment variables, or None if disabled"""
+        if os.environ.get('REVIEW_WRITE_BEHIND', '0').lower() not in ('1', 'true', 'yes', 'on'):
+            return None
+        return cls(flashcard_model,
+                   flush_interval=float(os.environ.get('REVIEW_FLUSH_INTERVAL', 1.0)),
+                   max_batch=int(os.environ.get('REVIEW_FLUSH_BATCH', 200)),
+                   max_queue=int(os.environ.get('REVIEW_QUEUE_SIZE', 10000)),
+                   overflow=os.environ.get('REVIEW_QUEUE_OVERFLOW', 'sync'))
+
+    def _ensure_thread(self):
+        """Start the flusher thread (again after fork, since threads don't survive it)"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Items queued by the parent belong to the parent's flusher
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='review-write-behind', daemon=True)
+                self._thread.start()
+
+    def submit(self, reviews):
+        """Queue reviews for a group commit, returning the number of reviews queued"""
+        self._ensure_thread()
+        now = utcnow()
+        queued = 0
+        overflow = []
+        for review in reviews:
+            # Stamp the review now so the flush delay doesn't shift its time
+            review = dict(review, reviewed_at=review.get('reviewed_at') or now)
+            try:
+                if self.overflow == 'block':
+                    self._queue.put(review)
+                else:
+                    self._queue.put_nowait(review)
+                queued += 1
+            except queue.Full:
+                overflow.append(review)
+        if overflow:
+            # The queue is full: apply backpressure by writing synchronously
+            self.flashcard_model.record_reviews(overflow)
+        return queued
+
+    def flush(self):
+        """Block until every review queued so far has been committed"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """Flush queued reviews and stop the flusher thread"""
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            batch = []
+            done = 1
+            if item is _STOP:
+                stopping = True
+            elif item is not _FLUSH:
+                batch.append(item)
+                # Gather more reviews until the batch is full or the interval elapses
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    done += 1
+                    if item is _FLUSH:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+            if batch:
+                self._write(batch)
+            for _ in range(done):
+                self._queue.task_done()
+
+    def _write(self, batch):
+        """Commit one group of reviews, retrying transient failures such as a busy database"""
+        for attempt in range(1, self.WRITE_ATTEMPTS + 1):
+            try:
+                self.flashcard_model.record_reviews(batch)
+                return
+            except Exception:
+                if attempt == self.WRITE_ATTEMPTS:
+                    logger.exception('Dropped %d buffered reviews after %d attempts',
+                                     len(batch), attempt)
+                else:
+                    time.sleep(0.1 * attempt)
@@ -0,0 +1,255 @@
+"""Spaced-repetition schedulers for flashcard reviews
+
+A scheduler turns a card's stored scheduling state plus a 1-5 performance
+rating into the card's new state and the interval until its next review.
+SM-2 and FSRS are provided; pick one with the SCHEDULER environment variable
+or register your own with register_scheduler.
+
+Usage:
+    python scheduler.py reschedule [--scheduler fsrs] [--desired-retention 0.85]
+"""
+
+import argparse
+import datetime
+import math
+import os
+import sqlite3
+
+# Timestamp format used by SQLite's datetime('now') (UTC)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Per-card columns a scheduler reads and writes
+STATE_COLUMNS = ('difficulty_level', 'ease', 'stability', 'difficulty', 'interval_days')
+
+def utcnow():
+    """Current UTC time as a naive datetime, matching SQLite's datetime('now')"""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+def format_timestamp(value):
+    """Format a datetime the way SQLite stores timestamps"""
+    return value.strftime(TIMESTAMP_FORMAT)
+
+def parse_timestamp(value):
+    """Parse a timestamp stored by SQLite, returning None for empty values"""
+    if not value:
+        return None
+    return datetime.datetime.strptime(value[:19], TIMESTAMP_FORMAT)
+
+class Scheduler:
+    """Base class for spaced-repetition schedulers"""
+
+    name = None
+
+    def __init__(self, max_interval=36500):
+        self.max_interval = max_interval
+
+    def review(self, state, rating, elapsed_days):
+        """Return the new scheduling state after a review rated 1-5"""
+        raise NotImplementedError
+
+    def interval(self, state):
+        """Return the number of days until the next review for a post-review state"""
+        raise NotImplementedError
+
+    def schedule(self, card, rating, reviewed_at):
+        """Apply a review to a card row, returning the state columns plus next_due_at"""
+        last_reviewed = parse_timestamp(card['last_reviewed'])
+        if last_reviewed is None:
+            elapsed_days = 0.0
+        else:
+            elapsed_days = max(0.0, (reviewed_at - last_reviewed).total_seconds() / 86400)
+
+        state = self.review({column: card[column] for column in STATE_COLUMNS}, rating, elapsed_days)
+        days = min(self.interval(state), self.max_interval)
+        state['next_due_at'] = format_timestamp(reviewed_at + datetime.timedelta(days=days))
+        return state
+
+    def _interval_from_columns(self, difficulty_level, ease, stability, difficulty, interval_days):
+        """SQLite function wrapper around interval() used by reschedule_all"""
+        state = {
+            'difficulty_level': difficulty_level,
+            'ease': ease,
+            'stability': stability,
+            'difficulty': difficulty,
+            'interval_days': interval_days,
+        }
+        return min(self.interval(state), self.max_interval)
+
+    def reschedule_all(self, conn):
+        """Recompute next_due_at for every reviewed card in one set-based UPDATE"""
+        # The interval function runs inside SQLite's own row loop, so the whole
+        # deck is rescheduled in a single statement and a single transaction
+        conn.create_function('scheduled_interval', 5, self._interval_from_columns, deterministic=True)
+        cursor = conn.execute('''
+            UPDATE flashcards
+            SET next_due_at = datetime(last_reviewed, printf('%+.6f days',
+                scheduled_interval(difficulty_level, ease, stability, difficulty, interval_days)))
+            WHERE last_reviewed IS NOT NULL
+        ''')
+        conn.commit()
+        return cursor.rowcount
+
+class SM2Scheduler(Scheduler):
+    """SuperMemo-2: an ease factor per card multiplies the previous interval"""
+
+    name = 'sm2'
+
+    def __init__(self, initial_ease=2.5, minimum_ease=1.3, interval_modifier=1.0, max_interval=36500):
+        super().__init__(max_interval)
+        self.initial_ease = initial_ease
+        self.minimum_ease = minimum_ease
+        self.interval_modifier = interval_modifier
+
+    def review(self, state, rating, elapsed_days):
+        """Return the new scheduling state after a review rated 1-5"""
+        repetitions = state['difficulty_level'] or 0
+        ease = state['ease'] or self.initial_ease
+        # Cards scheduled by the old difficulty_level + 1 rule have no stored interval
+        previous = state['interval_days'] or repetitions + 1
+
+        if rating >= 3:
+            if repetitions == 0:
+                interval = 1
+            elif repetitions == 1:
+                interval = 6
+            else:
+                interval = previous * ease
+            repetitions += 1
+        else:
+            repetitions = 0
+            interval = 1
+
+        quality_gap = 5 - rating
+        ease = max(self.minimum_ease, ease + 0.1 - quality_gap * (0.08 + quality_gap * 0.02))
+
+        return {
+            'difficulty_level': repetitions,
+            'ease': ease,
+            'stability': state['stability'],
+            'difficulty': state['difficulty'],
+            'interval_days': interval,
+        }
+
+    def interval(self, state):
+        """Return the number of days until the next review for a post-review state"""
+        base = state['interval_days'] or (state['difficulty_level'] or 0) + 1
+        return base * self.interval_modifier
+
+class FSRSScheduler(Scheduler):
+    """Free Spaced Repetition Scheduler (FSRS-4.5) with its published default weights"""
+
+    name = 'fsrs'
+
+    DEFAULT_WEIGHTS = (
+        0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+        0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+    )
+    DECAY = -0.5
+    FACTOR = 19 / 81  # makes retrievability 90% after one stability interval
+
+    # Our 1-5 ratings mapped onto FSRS grades (1 again, 2 hard, 3 good, 4 easy)
+    GRADES = {1: 1, 2: 2, 3: 3, 4: 3, 5: 4}
+
+    def __init__(self, weights=None, desired_retention=0.9, max_interval=36500):
+        super().__init__(max_interval)
+        self.w = tuple(weights or self.DEFAULT_WEIGHTS)
+        self.desired_retention = desired_retention
+
+    def _initial_difficulty(self, grade):
+        return self.w[4] - (grade - 3) * self.w[5]
+
+    def _retrievability(self, elapsed_days, stability):
+        return (1 + self.FACTOR * elapsed_days / stability) ** self.DECAY
+
+    def review(self, state, rating, elapsed_days):
+        """Return the new scheduling state after a review rated 1-5"""
+        w = self.w
+        grade = self.GRADES[rating]
+        repetitions = state['difficulty_level'] or 0
+        stability = state['stability']
+        difficulty = state['difficulty']
+
+        if not stability or not difficulty:
+            # First review under FSRS
+            stability = w[grade - 1]
+            difficulty = self._initial_difficulty(grade)
+        else:
+            retrievability = self._retrievability(elapsed_days, stability)
+            difficulty = difficulty - w[6] * (grade - 3)
+            difficulty = w[7] * self._initial_difficulty(4) + (1 - w[7]) * difficulty
+            if grade == 1:
+                stability = min(stability, w[11] * difficulty ** -w[12]
+                                * ((stability + 1) ** w[13] - 1)
+                                * math.exp(w[14] * (1 - retrievability)))
+            else:
+                hard_penalty = w[15] if grade == 2 else 1
+                easy_bonus = w[16] if grade == 4 else 1
+                stability = stability * (1 + math.exp(w[8]) * (11 - difficulty)
+                                         * stability ** -w[9]
+                                         * (math.exp(w[10] * (1 - retrievability)) - 1)
+                                         * hard_penalty * easy_bonus)
+
+        difficulty = min(10.0, max(1.0, difficulty))
+        repetitions = repetitions + 1 if grade > 1 else 0
+        state = {
+            'difficulty_level': repetitions,
+            'ease': state['ease'],
+            'stability': stability,
+            'difficulty': difficulty,
+        }
+        state['interval_days'] = self.interval(state)
+        return state
+
+    def interval(self, state):
+        """Return the number of days until the next review for a post-review state"""
+        stability = state['stability']
+        if not stability:
+            # Not yet reviewed under FSRS: keep the old difficulty_level + 1 rule
+            return (state['difficulty_level'] or 0) + 1
+        return max(1.0, stability / self.FACTOR * (self.desired_retention ** (1 / self.DECAY) - 1))
+
+SCHEDULERS = {
+    SM2Scheduler.name: SM2Scheduler,
+    FSRSScheduler.name: FSRSScheduler,
+}
+
+def register_scheduler(scheduler_class):
+    """Make a Scheduler subclass available to get_scheduler under its name"""
+    SCHEDULERS[scheduler_class.name] = scheduler_class
+    return scheduler_class
+
+def get_scheduler(name=None, **params):
+    """Create the scheduler selected by name or the SCHEDULER environment variable"""
+    name = name or os.environ.get('SCHEDULER', SM2Scheduler.name)
+    if name not in SCHEDULERS:
+        raise ValueError(f'Unknown scheduler: {name}')
+    return SCHEDULERS[name](**params)
+
+def main():
+    from schema import DATABASE_PATH
+
+    parser = argparse.ArgumentParser(description='Reschedule every reviewed flashcard')
+    parser.add_argument('command', choices=['reschedule'])
+    parser.add_argument('--database', default=DATABASE_PATH)
+    parser.add_argument('--scheduler', default=None, help='sm2 or fsrs (default: $SCHEDULER or sm2)')
+    parser.add_argument('--desired-retention', type=float, help='FSRS target recall probability')
+    parser.add_argument('--interval-modifier', type=float, help='SM-2 interval multiplier')
+    parser.add_argument('--max-interval', type=float, help='Longest interval in days')
+    args = parser.parse_args()
+
+    params = {}
+    if args.desired_retention is not None:
+        params['desired_retention'] = args.desired_retention
+    if args.interval_modifier is not None:
+        params['interval_modifier'] = args.interval_modifier
+    if args.max_interval is not None:
+        params['max_interval'] = args.max_interval
+
+    scheduler = get_scheduler(args.scheduler, **params)
+    conn = sqlite3.connect(args.database)
+    count = scheduler.reschedule_all(conn)
+    conn.close()
+    print(f'Rescheduled {count} flashcards with {scheduler.name}.')
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,548 @@
 import sqlite3
 import os
+import contextlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: migrations are not serialized between processes
+    fcntl = None
 
 # Use environment variable for database path or default to 'flashcards.db'
 DATABASE_PATH = os.environ.get('DATABASE_PATH', 'flashcards.db')
 
-def create_tables():
-    """Create the necessary tables for the flashcard application"""
-    # Check if database file exists
-    db_exists = os.path.exists(DATABASE_PATH)
-    
-    # Connect to database (creates it if it doesn't exist)
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
-    # Create categories table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS categories (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL UNIQUE,
-        description TEXT
-    )
-    ''')
-    
-    # Create flashcards table
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS flashcards (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        category_id INTEGER,
-        front_content TEXT NOT NULL,
-        back_content TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_reviewed TIMESTAMP,
-        review_count INTEGER DEFAULT 0,
-        difficulty_level INTEGER DEFAULT 0,
-        FOREIGN KEY (category_id) REFERENCES categories (id)
+# Rows updated per transaction by backfills, so other writers get the
+# database between batches instead of waiting for the whole table
+BACKFILL_BATCH_SIZE = 5000
+
+# Schema changes are versioned migrations, applied in order, and PRAGMA
+# user_version records the last one applied. Databases created before
+# migrations existed are at version 0 and already have part of the schema,
+# so every migration must be safe to run on such a database, and to run
+# again after being interrupted (backfills commit in batches). Never change
+# a released migration: add a new one.
+
+@contextlib.contextmanager
+def transaction(conn):
+    """Run a block in one write transaction (conn must be in autocommit mode)"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+def create_index(conn, name, table, columns):
+    """Build an index in its own transaction, outside any other migration step
+
+    SQLite holds the write lock for the whole CREATE INDEX and cannot build
+    an index in batches, so writers wait for one complete build (seconds on
+    a few hundred thousand rows); readers are not blocked in WAL mode.
+    """
+    conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+def backfill(conn, table, assignments, condition):
+    """UPDATE table SET assignments WHERE condition, committing every BACKFILL_BATCH_SIZE rows"""
+    max_id = conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0] or 0
+    for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+        with transaction(conn):
+            conn.execute(f'''
+            UPDATE {table} SET {assignments}
+            WHERE rowid >= ? AND rowid < ? AND ({condition})
+            ''', (start, start + BACKFILL_BATCH_SIZE))
+
+def migrate_base_tables(conn):
+    with transaction(conn):
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            description TEXT
+        )
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS flashcards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_id INTEGER,
+            front_content TEXT NOT NULL,
+            back_content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_reviewed TIMESTAMP,
+            review_count INTEGER DEFAULT 0,
+            difficulty_level INTEGER DEFAULT 0,
+            next_due_at TIMESTAMP,  -- NULL until the first review
+            shuffle_key INTEGER,  -- random sort key used to sample the review queue
+            ease REAL,  -- SM-2 ease factor
+            stability REAL,  -- FSRS memory stability in days
+            difficulty REAL,  -- FSRS difficulty (1-10)
+            interval_days REAL,  -- last scheduled interval
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+        ''')
+        # Review history for spaced repetition
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS review_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            flashcard_id INTEGER,
+            reviewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            performance_rating INTEGER,  -- 1-5 rating of how well the user remembered
+            FOREIGN KEY (flashcard_id) REFERENCES flashcards (id)
+        )
+        ''')
+
+def migrate_deck_manifest(conn):
+    # Content hashes of cards written by deck_sync.py, per deck
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS deck_manifest (
+        deck TEXT NOT NULL,
+        card_key TEXT NOT NULL,  -- hash of normalized category and front
+        content_hash TEXT NOT NULL,  -- hash of normalized back
+        flashcard_id INTEGER NOT NULL,
+        PRIMARY KEY (deck, card_key)
     )
     ''')
+
+def migrate_data_versions(conn):
+    # Change counters bumped by triggers, so caches in every worker process can
+    # tell when a table changed without re-reading it, and the time of the last
+    # change for Last-Modified headers
+    with transaction(conn):
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        if add_column_if_missing(conn, 'data_versions', 'updated_at', 'TIMESTAMP'):
+            conn.execute("UPDATE data_versions SET updated_at = datetime('now')")
+        
+        # shuffle_key is internal to the review queue and is rewritten right after
+        # every insert, so updates that only touch it don't count as a change.
+        # Triggers are recreated because older ones didn't set updated_at
+        version_events = {
+            'categories': ('INSERT', 'UPDATE', 'DELETE'),
+            'flashcards': ('INSERT', 'DELETE',
+                           'UPDATE OF category_id, front_content, back_content, last_reviewed, '
+                           'review_count, difficulty_level, next_due_at, ease, stability, difficulty, '
+                           'interval_days'),
+        }
+        for table, events in version_events.items():
+            conn.execute("INSERT OR IGNORE INTO data_versions (name) VALUES (?)", (table,))
+            for event in events:
+                trigger = f'{table}_version_{event.split()[0].lower()}'
+                conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+                conn.execute(f'''
+                CREATE TRIGGER {trigger}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_versions SET version = version + 1, updated_at = datetime('now')
+                    WHERE name = '{table}';
+                END
+                ''')
+
+def migrate_next_due_at(conn):
+    # Databases created before next_due_at existed get the column and a backfill
+    # using the interval rule the review query used to compute on the fly
+    add_column_if_missing(conn, 'flashcards', 'next_due_at', 'TIMESTAMP')
+    backfill(conn, 'flashcards',
+             "next_due_at = datetime(last_reviewed, '+' || (difficulty_level + 1) || ' days')",
+             'next_due_at IS NULL AND last_reviewed IS NOT NULL')
     
-    # Create review history table for spaced repetition
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS review_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        flashcard_id INTEGER,
-        reviewed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        performance_rating INTEGER,  -- 1-5 rating of how well the user remembered
-        FOREIGN KEY (flashcard_id) REFERENCES flashcards (id)
-    )
+    # Lets the review query range-scan due cards instead of scanning the table
+    create_index(conn, 'idx_flashcards_next_due_at', 'flashcards', 'next_due_at')
+
+def migrate_scheduler_state(conn):
+    # Per-card scheduler state (see scheduler.py); NULL means the scheduler's default
+    for column, definition in (('ease', 'REAL'), ('stability', 'REAL'),
+                               ('difficulty', 'REAL'), ('interval_days', 'REAL')):
+        add_column_if_missing(conn, 'flashcards', column, definition)
+
+def migrate_shuffle_key(conn):
+    # Random per-card key, assigned on insert by the trigger below (ALTER TABLE
+    # cannot add a column with a non-constant default), so the review queue can
+    # be sampled by walking an index from a random pivot
+    add_column_if_missing(conn, 'flashcards', 'shuffle_key', 'INTEGER')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS flashcards_assign_shuffle_key
+    AFTER INSERT ON flashcards
+    WHEN NEW.shuffle_key IS NULL
+    BEGIN
+        UPDATE flashcards SET shuffle_key = random() WHERE id = NEW.id;
+    END
     ''')
-    
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
-    
+    backfill(conn, 'flashcards', 'shuffle_key = random()', 'shuffle_key IS NULL')
+    create_index(conn, 'idx_flashcards_shuffle_key', 'flashcards', 'shuffle_key')
+
+def migrate_front_content_index(conn):
+    # Content lookups by front text (deck patches and sync scripts)
+    create_index(conn, 'idx_flashcards_front_content', 'flashcards', 'front_content')
+
+def migrate_full_text_search(conn):
+    # Full-text index over card content, kept in sync by triggers. Diacritics
+    # are folded so "acucar" also finds "açúcar" in the Portuguese backs.
+    # Indexing existing cards can't be split into batches without the
+    # triggers seeing half-indexed cards, so it is one transaction
+    try:
+        with transaction(conn):
+            fts_exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'flashcards_fts'").fetchone() is not None
+            conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS flashcards_fts USING fts5(
+                front_content,
+                back_content,
+                content='flashcards',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            ''')
+            conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS flashcards_fts_insert AFTER INSERT ON flashcards
+            BEGIN
+                INSERT INTO flashcards_fts (rowid, front_content, back_content)
+                VALUES (NEW.id, NEW.front_content, NEW.back_content);
+            END
+            ''')
+            conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS flashcards_fts_delete AFTER DELETE ON flashcards
+            BEGIN
+                INSERT INTO flashcards_fts (flashcards_fts, rowid, front_content, back_content)
+                VALUES ('delete', OLD.id, OLD.front_content, OLD.back_content);
+            END
+            ''')
+            conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS flashcards_fts_update
+            AFTER UPDATE OF front_content, back_content ON flashcards
+            BEGIN
+                INSERT INTO flashcards_fts (flashcards_fts, rowid, front_content, back_content)
+                VALUES ('delete', OLD.id, OLD.front_content, OLD.back_content);
+                INSERT INTO flashcards_fts (rowid, front_content, back_content)
+                VALUES (NEW.id, NEW.front_content, NEW.back_content);
+            END
+            ''')
+            if not fts_exists:
+                # Index the cards that existed before the search table
+                conn.execute("INSERT INTO flashcards_fts (flashcards_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError as e:
+        if 'fts5' not in str(e):
+            raise
+        # SQLite built without FTS5: no flashcards_fts table is created and
+        # Flashcard.search_flashcards falls back to LIKE matching
+        print("Full-text search disabled: SQLite FTS5 is not available, using plain text search.")
+
+def migrate_pagination_indexes(conn):
+    # Keyset pagination on (created_at, id), newest first, with and without a
+    # category filter (id is the rowid, so it is implicitly the last index column)
+    create_index(conn, 'idx_flashcards_created_at', 'flashcards', 'created_at')
+    create_index(conn, 'idx_flashcards_category_created_at', 'flashcards', 'category_id, created_at')
+
+def migrate_review_history_index(conn):
+    # Review history per card, used by exports and when deleting a card
+    create_index(conn, 'idx_review_history_flashcard_id', 'review_history', 'flashcard_id')
+
+def migrate_study_stats(conn):
+    # Review totals per UTC day and category, added to by a trigger on every
+    # review, so the stats dashboard never reads review_history. Reviews count
+    # under the card's category at review time (0 when it has none), and stay
+    # counted when cards are deleted, like any other study log
+    with transaction(conn):
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            reviews INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            recalled INTEGER NOT NULL DEFAULT 0,  -- reviews rated 3 or higher
+            PRIMARY KEY (day, category_id)
+        ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS review_history_daily_stats AFTER INSERT ON review_history
+        WHEN date(NEW.reviewed_at) IS NOT NULL
+        BEGIN
+            INSERT INTO daily_stats (day, category_id, reviews, rating_sum, recalled)
+            VALUES (date(NEW.reviewed_at),
+                    COALESCE((SELECT category_id FROM flashcards WHERE id = NEW.flashcard_id), 0),
+                    1, COALESCE(NEW.performance_rating, 0), NEW.performance_rating >= 3)
+            ON CONFLICT (day, category_id) DO UPDATE SET
+                reviews = reviews + 1,
+                rating_sum = rating_sum + excluded.rating_sum,
+                recalled = recalled + excluded.recalled;
+        END
+        ''')
+        # One pass over the existing history, in the same transaction as the
+        # trigger so no review is counted twice or missed
+        conn.execute('DELETE FROM daily_stats')
+        conn.execute('''
+        INSERT INTO daily_stats (day, category_id, reviews, rating_sum, recalled)
+        SELECT date(r.reviewed_at), COALESCE(f.category_id, 0), COUNT(*),
+               SUM(COALESCE(r.performance_rating, 0)), SUM(r.performance_rating >= 3)
+        FROM review_history r LEFT JOIN flashcards f ON f.id = r.flashcard_id
+        WHERE date(r.reviewed_at) IS NOT NULL
+        GROUP BY 1, 2
+        ''')
+
+        # Scheduled cards per UTC due date and category, kept exact by triggers
+        # on flashcards, so due counts are a sum over a few rows per day instead
+        # of a count over the cards. Rows that drop to zero are removed.
+        # Timestamps SQLite can't parse are left out of both aggregates rather
+        # than failing the write
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS due_forecast (
+            day TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            cards INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category_id)
+        ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS flashcards_due_forecast_insert
+        AFTER INSERT ON flashcards
+        WHEN date(NEW.next_due_at) IS NOT NULL
+        BEGIN
+            INSERT INTO due_forecast (day, category_id, cards)
+            VALUES (date(NEW.next_due_at), COALESCE(NEW.category_id, 0), 1)
+            ON CONFLICT (day, category_id) DO UPDATE SET cards = cards + 1;
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS flashcards_due_forecast_delete
+        AFTER DELETE ON flashcards
+        WHEN date(OLD.next_due_at) IS NOT NULL
+        BEGIN
+            UPDATE due_forecast SET cards = cards - 1
+            WHERE day = date(OLD.next_due_at) AND category_id = COALESCE(OLD.category_id, 0);
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS flashcards_due_forecast_update
+        AFTER UPDATE OF next_due_at, category_id ON flashcards
+        WHEN date(OLD.next_due_at) IS NOT date(NEW.next_due_at)
+            OR OLD.category_id IS NOT NEW.category_id
+        BEGIN
+            UPDATE due_forecast SET cards = cards - 1
+            WHERE day = date(OLD.next_due_at) AND category_id = COALESCE(OLD.category_id, 0);
+            INSERT INTO due_forecast (day, category_id, cards)
+            SELECT date(NEW.next_due_at), COALESCE(NEW.category_id, 0), 1
+            WHERE date(NEW.next_due_at) IS NOT NULL
+            ON CONFLICT (day, category_id) DO UPDATE SET cards = cards + 1;
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS due_forecast_remove_empty
+        AFTER UPDATE OF cards ON due_forecast
+        WHEN NEW.cards <= 0
+        BEGIN
+            DELETE FROM due_forecast WHERE day = NEW.day AND category_id = NEW.category_id;
+        END
+        ''')
+        conn.execute('DELETE FROM due_forecast')
+        conn.execute('''
+        INSERT INTO due_forecast (day, category_id, cards)
+        SELECT date(next_due_at), COALESCE(category_id, 0), COUNT(*)
+        FROM flashcards WHERE date(next_due_at) IS NOT NULL
+        GROUP BY 1, 2
+        ''')
+
+def migrate_category_counts(conn):
+    # Cards and never-reviewed cards per category (0 for cards without one),
+    # kept exact by triggers on flashcards, so category lists and the delete
+    # check read one row per category instead of counting cards
+    with transaction(conn):
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS category_counts (
+            category_id INTEGER PRIMARY KEY,
+            cards INTEGER NOT NULL DEFAULT 0,
+            new_cards INTEGER NOT NULL DEFAULT 0  -- next_due_at IS NULL
+        )
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS flashcards_category_counts_insert AFTER INSERT ON flashcards
+        BEGIN
+            INSERT INTO category_counts (category_id, cards, new_cards)
+            VALUES (COALESCE(NEW.category_id, 0), 1, NEW.next_due_at IS NULL)
+            ON CONFLICT (category_id) DO UPDATE SET
+                cards = cards + 1,
+                new_cards = new_cards + excluded.new_cards;
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS flashcards_category_counts_delete AFTER DELETE ON flashcards
+        BEGIN
+            UPDATE category_counts SET cards = cards - 1, new_cards = new_cards - (OLD.next_due_at IS NULL)
+            WHERE category_id = COALESCE(OLD.category_id, 0);
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS flashcards_category_counts_update
+        AFTER UPDATE OF category_id, next_due_at ON flashcards
+        WHEN OLD.category_id IS NOT NEW.category_id
+            OR (OLD.next_due_at IS NULL) != (NEW.next_due_at IS NULL)
+        BEGIN
+            UPDATE category_counts SET cards = cards - 1, new_cards = new_cards - (OLD.next_due_at IS NULL)
+            WHERE category_id = COALESCE(OLD.category_id, 0);
+            INSERT INTO category_counts (category_id, cards, new_cards)
+            VALUES (COALESCE(NEW.category_id, 0), 1, NEW.next_due_at IS NULL)
+            ON CONFLICT (category_id) DO UPDATE SET
+                cards = cards + 1,
+                new_cards = new_cards + excluded.new_cards;
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS categories_category_counts_delete AFTER DELETE ON categories
+        BEGIN
+            DELETE FROM category_counts WHERE category_id = OLD.id;
+        END
+        ''')
+        conn.execute('DELETE FROM category_counts')
+        conn.execute('''
+        INSERT INTO category_counts (category_id, cards, new_cards)
+        SELECT COALESCE(category_id, 0), COUNT(*), SUM(next_due_at IS NULL)
+        FROM flashcards
+        GROUP BY 1
+        ''')
+
+def migrate_due_rollup(conn):
+    # Cards due before the roll-up day are filed under that day instead of
+    # their own, and models.roll_up_due_forecast moves the roll-up day up to
+    # today, folding in the days it passes, so due-now counts read one
+    # due_forecast row per category however long the history is. The
+    # roll-up day starts empty, which files every card under its own day
+    # until the app first rolls up
+    with transaction(conn):
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS due_rollup (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            day TEXT NOT NULL
+        )
+        ''')
+        conn.execute("INSERT OR IGNORE INTO due_rollup (id, day) VALUES (1, '')")
+        for name in ('flashcards_due_forecast_insert', 'flashcards_due_forecast_delete',
+                     'flashcards_due_forecast_update'):
+            conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute('''
+        CREATE TRIGGER flashcards_due_forecast_insert
+        AFTER INSERT ON flashcards
+        WHEN date(NEW.next_due_at) IS NOT NULL
+        BEGIN
+            INSERT INTO due_forecast (day, category_id, cards)
+            VALUES (max(date(NEW.next_due_at), (SELECT day FROM due_rollup)), COALESCE(NEW.category_id, 0), 1)
+            ON CONFLICT (day, category_id) DO UPDATE SET cards = cards + 1;
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER flashcards_due_forecast_delete
+        AFTER DELETE ON flashcards
+        WHEN date(OLD.next_due_at) IS NOT NULL
+        BEGIN
+            UPDATE due_forecast SET cards = cards - 1
+            WHERE day = max(date(OLD.next_due_at), (SELECT day FROM due_rollup))
+                AND category_id = COALESCE(OLD.category_id, 0);
+        END
+        ''')
+        conn.execute('''
+        CREATE TRIGGER flashcards_due_forecast_update
+        AFTER UPDATE OF next_due_at, category_id ON flashcards
+        WHEN date(OLD.next_due_at) IS NOT date(NEW.next_due_at)
+            OR OLD.category_id IS NOT NEW.category_id
+        BEGIN
+            UPDATE due_forecast SET cards = cards - 1
+            WHERE day = max(date(OLD.next_due_at), (SELECT day FROM due_rollup))
+                AND category_id = COALESCE(OLD.category_id, 0);
+            INSERT INTO due_forecast (day, category_id, cards)
+            SELECT max(date(NEW.next_due_at), (SELECT day FROM due_rollup)), COALESCE(NEW.category_id, 0), 1
+            WHERE date(NEW.next_due_at) IS NOT NULL
+            ON CONFLICT (day, category_id) DO UPDATE SET cards = cards + 1;
+        END
+        ''')
+
+def migrate_shuffle_due_index(conn):
+    # The review queue walks idx_flashcards_shuffle_key and keeps the due cards.
+    # With next_due_at in the index the due check is answered from the index
+    # instead of a table lookup per entry, so sampling stays O(limit) when few
+    # cards are due. The index keeps its name, which get_cards_for_review
+    # forces with INDEXED BY, and is swapped in one transaction
+    columns = [row[2] for row in conn.execute("PRAGMA index_info('idx_flashcards_shuffle_key')").fetchall()]
+    if columns == ['shuffle_key', 'next_due_at']:
+        return
+    with transaction(conn):
+        conn.execute('DROP INDEX IF EXISTS idx_flashcards_shuffle_key')
+        conn.execute('CREATE INDEX idx_flashcards_shuffle_key ON flashcards (shuffle_key, next_due_at)')
+
+# (version, description, function applying it)
+MIGRATIONS = [
+    (1, 'categories, flashcards and review_history tables', migrate_base_tables),
+    (2, 'deck_manifest table', migrate_deck_manifest),
+    (3, 'data_versions change counters', migrate_data_versions),
+    (4, 'flashcards.next_due_at and its index', migrate_next_due_at),
+    (5, 'per-card scheduler state', migrate_scheduler_state),
+    (6, 'flashcards.shuffle_key and its index', migrate_shuffle_key),
+    (7, 'index on flashcards.front_content', migrate_front_content_index),
+    (8, 'full-text search', migrate_full_text_search),
+    (9, 'pagination indexes', migrate_pagination_indexes),
+    (10, 'index on review_history.flashcard_id', migrate_review_history_index),
+    (11, 'daily_stats and due_forecast aggregates', migrate_study_stats),
+    (12, 'category_counts card counts', migrate_category_counts),
+    (13, 'due_forecast roll-up of overdue days', migrate_due_rollup),
+    (14, 'next_due_at in the shuffle_key index', migrate_shuffle_due_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+@contextlib.contextmanager
+def migration_lock(path):
+    """Hold an exclusive lock on path + '.migrate.lock', so one process migrates at a time"""
+    if fcntl is None:
+        yield
+        return
+    with open(f'{path}.migrate.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(path=None, target=LATEST_VERSION):
+    """Apply the pending migrations up to target, returning how many were applied"""
+    # Fast path for every startup after the first: one PRAGMA read, no lock
+    path = path or DATABASE_PATH
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        if get_schema_version(conn) >= target:
+            return 0
+        
+        # Wait for writers from running workers instead of failing
+        conn.execute('PRAGMA busy_timeout = 30000')
+        with migration_lock(path):
+            # Another process may have migrated while we waited for the lock
+            version = get_schema_version(conn)
+            applied = 0
+            for number, description, apply in MIGRATIONS:
+                if version < number <= target:
+                    print(f'Applying migration {number}: {description}')
+                    apply(conn)
+                    conn.execute(f'PRAGMA user_version = {number}')
+                    applied += 1
+            return applied
+    finally:
+        conn.close()
+
+def create_tables():
+    """Create or upgrade the database schema, returning whether the database already existed"""
+    db_exists = os.path.exists(DATABASE_PATH)
+    migrate(DATABASE_PATH)
     return db_exists
 
+def add_column_if_missing(cursor, table, column, definition):
+    """Add a column to an existing table, returning True if it was added"""
+    if any(row[1] == column for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()):
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
 def initialize_database():
     """Initialize the database with default categories if needed"""
     db_exists = create_tables()
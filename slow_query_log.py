@@ -0,0 +1,146 @@
+"""Slow-query log with EXPLAIN QUERY PLAN capture
+
+A DatabaseManager query listener that writes every statement slower than a
+threshold as one JSON line: the SQL and its bound parameters, how long it
+took (executing it and fetching its rows), the function that ran it (e.g.
+models.Flashcard.get_cards_for_review), the route being served and the
+query plan SQLite chose, so a slow page can be traced to a table scan
+without reproducing it.
+
+The plan is captured on a separate connection, so it never interferes with
+the transaction of the statement being logged.
+
+Configuration (environment variables):
+    SLOW_QUERY_MS       threshold in milliseconds; unset disables the log
+    SLOW_QUERY_LOG      file to append to (default: standard error)
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import sys
+import sysconfig
+import threading
+
+from flask import has_request_context, request
+
+from models import DatabaseManager, InstrumentedConnection, InstrumentedCursor
+
+# Statements EXPLAIN QUERY PLAN is worth running for
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# Longest bound string value written to the log
+MAX_PARAMETER_LENGTH = 200
+
+# Standard library frames (e.g. contextlib running DatabaseManager.connection,
+# which reports statements left unfetched when the block exits) are never callers
+STDLIB_DIRS = tuple(os.path.join(os.path.realpath(sysconfig.get_paths()[name]), '')
+                    for name in ('stdlib', 'platstdlib'))
+PACKAGE_DIRS = ('site-packages', 'dist-packages')
+
+class SlowQueryLog:
+    """Writes statements slower than threshold_ms as JSON lines"""
+
+    def __init__(self, db_path, threshold_ms, path=None):
+        self.db_path = db_path
+        self.threshold = threshold_ms / 1000.0
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, db_manager):
+        """Create a log from SLOW_QUERY_* environment variables and attach it, or return None"""
+        threshold = os.environ.get('SLOW_QUERY_MS')
+        if not threshold:
+            return None
+        log = cls(db_manager.db_path, float(threshold), os.environ.get('SLOW_QUERY_LOG') or None)
+        db_manager.add_query_listener(log.record_query)
+        return log
+
+    def record_query(self, sql, parameters, seconds):
+        """Query listener: log the statement if it was slow"""
+        if seconds < self.threshold:
+            return
+        entry = {
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'duration_ms': round(seconds * 1000, 3),
+            'sql': ' '.join(sql.split()),
+            'parameters': format_parameters(parameters),
+            'caller': None,
+            'location': None,
+            'route': None,
+            'plan': None,
+        }
+        caller = find_caller(sys._getframe(1))
+        if caller is not None:
+            code = caller.f_code
+            entry['caller'] = f"{caller.f_globals.get('__name__')}.{getattr(code, 'co_qualname', code.co_name)}"
+            entry['location'] = f'{os.path.basename(code.co_filename)}:{caller.f_lineno}'
+        if has_request_context():
+            entry['route'] = {'endpoint': request.endpoint, 'method': request.method, 'path': request.path}
+        if parameters is not None and sql.lstrip().upper().startswith(EXPLAINABLE):
+            try:
+                entry['plan'] = self.explain(sql, parameters)
+            except sqlite3.Error as e:
+                entry['plan_error'] = str(e)
+        self.write(entry)
+
+    def explain(self, sql, parameters):
+        """EXPLAIN QUERY PLAN output as indented lines, like the sqlite3 shell prints it"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        finally:
+            conn.close()
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return lines
+
+    def write(self, entry):
+        line = json.dumps(entry, default=str) + '\n'
+        with self._lock:
+            if self.path is None:
+                sys.stderr.write(line)
+                sys.stderr.flush()
+                return
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            except OSError:
+                pass
+
+def find_caller(frame):
+    """The innermost frame outside the connection pool, its cursors, this module and the standard library"""
+    while frame is not None:
+        if (frame.f_globals.get('__name__') != __name__ and
+                not is_stdlib(frame.f_code.co_filename) and
+                not isinstance(frame.f_locals.get('self'),
+                               (InstrumentedCursor, InstrumentedConnection, DatabaseManager))):
+            return frame
+        frame = frame.f_back
+    return None
+
+def is_stdlib(filename):
+    """Whether a code file belongs to the standard library (installed packages don't)"""
+    filename = os.path.realpath(filename)
+    return (filename.startswith(STDLIB_DIRS) and
+            not any(name in filename.split(os.sep) for name in PACKAGE_DIRS))
+
+def format_parameters(parameters):
+    """Bound parameters made JSON-friendly, with long values shortened"""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: format_parameter(value) for key, value in parameters.items()}
+    return [format_parameter(value) for value in parameters]
+
+def format_parameter(value):
+    if isinstance(value, bytes):
+        return f'<{len(value)} bytes>'
+    if isinstance(value, str) and len(value) > MAX_PARAMETER_LENGTH:
+        return value[:MAX_PARAMETER_LENGTH] + '...'
+    return value
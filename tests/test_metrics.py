@@ -0,0 +1,37 @@
+"""Aggregation of per-worker metric snapshots"""
+
+import json
+import os
+import subprocess
+import sys
+
+from metrics import Metrics
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def write_snapshot(directory, pid, values):
+    with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+        json.dump(values, f)
+
+def test_exited_worker_values_stay_counted(tmp_path):
+    metrics = Metrics(str(tmp_path))
+    metrics.inc('flashcards_db_queries_total', amount=2)
+    metrics.observe('flashcards_db_query_duration_seconds', 0.002)
+    write_snapshot(tmp_path, exited_pid(), [
+        ['flashcards_db_queries_total', [], 5],
+        ['flashcards_db_query_duration_seconds', [], [0, 0, 0, 3, 0, 0, 0, 0, 0, 0.006, 3]],
+    ])
+
+    totals = metrics.collect()
+    assert totals[('flashcards_db_queries_total', ())] == 7
+    assert totals[('flashcards_db_query_duration_seconds', ())][-1] == 4
+
+    # The exited worker's snapshot is gone but its values are kept, once
+    assert sorted(os.listdir(tmp_path)) == sorted([f'{os.getpid()}.json', 'dead.json', 'dead.lock'])
+    assert metrics.collect()[('flashcards_db_queries_total', ())] == 7
+
+    write_snapshot(tmp_path, exited_pid(), [['flashcards_db_queries_total', [], 1]])
+    assert metrics.collect()[('flashcards_db_queries_total', ())] == 8
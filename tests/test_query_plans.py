@@ -0,0 +1,24 @@
+"""Query plans of every model statement, checked by query_plan_check.py"""
+
+import os
+
+import pytest
+
+from query_plan_check import build_database, run_checks
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='module')
+def generated_database(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('plans') / 'generated.db')
+    build_database(path, cards=2000)
+    return path
+
+def test_generated_database_plans(generated_database):
+    assert run_checks(generated_database) == 0
+
+def test_small_database_plans(tmp_path):
+    # The bundled deck is too small for the review backlog to count as large
+    path = str(tmp_path / 'small.db')
+    build_database(path, os.path.join(REPOSITORY, 'flashcards.db'))
+    assert run_checks(path) == 0
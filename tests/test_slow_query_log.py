@@ -0,0 +1,46 @@
+"""Callers reported by the slow-query log"""
+
+import json
+
+import pytest
+
+import schema
+from models import Category, DatabaseManager, Flashcard
+from slow_query_log import SlowQueryLog
+
+@pytest.fixture
+def logged(tmp_path):
+    path = str(tmp_path / 'slow.db')
+    schema.migrate(path)
+    db_manager = DatabaseManager(path)
+    log_path = tmp_path / 'slow.log'
+    db_manager.add_query_listener(SlowQueryLog(path, 0, str(log_path)).record_query)
+    yield db_manager, log_path
+    db_manager.close_all()
+
+def entries(log_path):
+    return [json.loads(line) for line in log_path.read_text().splitlines()]
+
+def test_fetchone_query_reports_model_method(logged):
+    db_manager, log_path = logged
+    categories = Category(db_manager)
+    category_id = categories.add_category('Verbs')['id']
+    card_id = Flashcard(db_manager).add_flashcard('ir', 'to go', category_id)['id']
+    log_path.write_text('')
+
+    # Single-row reads are reported when the connection goes back to the pool
+    categories.get_category_by_id(category_id)
+    Flashcard(db_manager).get_flashcard_by_id(card_id)
+
+    callers = {entry['sql'].split(' FROM ')[-1].split()[0]: entry['caller'] for entry in entries(log_path)}
+    assert callers['categories'] == 'models.Category.get_category_by_id'
+    assert callers['flashcards'] == 'models.Flashcard.get_flashcard_by_id'
+
+def test_connection_pragmas_report_model_method(logged):
+    db_manager, log_path = logged
+    Category(db_manager).get_category_by_id(1)
+
+    pragmas = [entry for entry in entries(log_path) if entry['sql'].startswith('PRAGMA')]
+    assert pragmas
+    assert {entry['caller'] for entry in pragmas} == {'models.Category.get_category_by_id'}
+    assert all(entry['location'].startswith('models.py:') for entry in pragmas)
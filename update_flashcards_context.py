@@ -1,15 +1,10 @@
-import sqlite3
-import os
+import sys
 
-def get_db_connection():
-    """Conecta ao banco de dados SQLite"""
-    return sqlite3.connect('flashcards.db')
+from deck_patch import DeckPatch, format_diff
+from models import DatabaseManager
 
-def update_flashcards_with_context():
+def update_flashcards_with_context(dry_run=False):
     """Atualiza os flashcards existentes com contexto adequado"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Dicionário com as atualizações contextualizadas
     updates = {
         # Phrasal Verbs com contexto
@@ -116,23 +111,21 @@ def update_flashcards_with_context():
     
     print("🔄 Atualizando flashcards com contexto...")
     
-    updated_count = 0
-    for old_content, new_content in updates.items():
-        cursor.execute('''
-            UPDATE flashcards 
-            SET front_content = ? 
-            WHERE front_content = ?
-        ''', (new_content, old_content))
-        
-        if cursor.rowcount > 0:
-            print(f"✓ Atualizado: {old_content} → {new_content}")
-            updated_count += cursor.rowcount
+    # Aplica todas as atualizações de uma vez, em uma única transação
+    patch = DeckPatch(DatabaseManager('flashcards.db'))
+    result = patch.apply(updates, match_column='front_content', set_column='front_content', dry_run=dry_run)
+    
+    if dry_run:
+        print(format_diff(result['changes'], 'front_content'))
+        print(f"\n🔍 Simulação: {result['rows_changed']} flashcards seriam atualizados.")
+        return
     
-    conn.commit()
-    conn.close()
+    for change in result['changes']:
+        print(f"✓ Atualizado: {change['old_value']} → {change['new_value']}")
+    updated_count = result['rows_changed']
     
     print(f"\n🎉 Sucesso! {updated_count} flashcards atualizados com contexto!")
     print("\nTodos os flashcards agora incluem frases completas e contextualizadas para melhor aprendizado.")
 
 if __name__ == "__main__":
-    update_flashcards_with_context()
\ No newline at end of file
+    update_flashcards_with_context(dry_run='--dry-run' in sys.argv)
\ No newline at end of file